@@ -0,0 +1,279 @@
+# Description: asyncio version of TweetMiner. Many user, topic and timeline queries run at once over one or more
+#              sets of credentials. A rate limiter shared by all queries tracks every endpoint's window per
+#              credential from the x-rate-limit headers, hands each request to a credential with calls left and
+#              only sleeps until the earliest window resets when all of them are used up. Requests go through a
+#              transport, so the miner can run offline against a stub of the API.
+
+import asyncio
+import time
+from functools import partial
+import requests
+import tweepy
+from tweepy.error import TweepError
+try:
+    from . import pipelineMetrics
+    from .tweetMiner import format_status, format_user
+except ImportError:
+    import pipelineMetrics
+    from tweetMiner import format_status, format_user
+
+API_ROOT = 'https://api.twitter.com/1.1/'
+RATE_WINDOW = 15 * 60
+
+# Requests per 15 minute window with user authentication, used until a response reports the real limit
+DEFAULT_LIMITS = {
+    'search/tweets':            180,
+    'statuses/user_timeline':   900,
+    'users/show':               900,
+    'users/lookup':             900,
+}
+
+class RateLimitWindow(object):
+
+    def __init__(self, limit, reset):
+        self.limit = limit
+        self.remaining = limit
+        self.reset = reset
+
+# Call budget of every (credential, endpoint) pair, shared by all in-flight requests
+class RateLimiter(object):
+
+    def __init__(self, credential_count, clock=time.time, sleep=asyncio.sleep, margin=1):
+        self.credential_count = credential_count
+        self.clock = clock
+        self.sleep = sleep
+        self.margin = margin
+        self.windows = {}
+        self.waited = 0.
+        self.lock = asyncio.Lock()
+
+    def window(self, credential, endpoint, now):
+        window = self.windows.get((credential, endpoint))
+        if window is None:
+            window = RateLimitWindow(DEFAULT_LIMITS.get(endpoint, 15), now + RATE_WINDOW)
+            self.windows[(credential, endpoint)] = window
+        elif window.reset <= now:
+            window.remaining = window.limit
+            window.reset = now + RATE_WINDOW
+        return window
+
+    # Take one call from the credential with the most calls left, sleeping until a window resets if none has any
+    async def acquire(self, endpoint):
+        while True:
+            async with self.lock:
+                now = self.clock()
+                windows = [self.window(credential, endpoint, now) for credential in range(self.credential_count)]
+                credential = max(range(self.credential_count), key=lambda i: windows[i].remaining)
+                if windows[credential].remaining > 0:
+                    windows[credential].remaining -= 1
+                    return credential
+                wait = min(window.reset for window in windows) - now + self.margin
+            print('Query limit reached for ' + endpoint + ', waiting ' + str(int(wait)) + ' seconds')
+            self.waited += wait
+            pipelineMetrics.observe_wait(endpoint, wait)
+            await self.sleep(wait)
+
+    # Correct the budget from a response's headers, a 429 response means the window is used up
+    def update(self, credential, endpoint, headers, status):
+        window = self.window(credential, endpoint, self.clock())
+        try:
+            limit = int(headers['x-rate-limit-limit'])
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset = float(headers['x-rate-limit-reset'])
+        except (KeyError, TypeError, ValueError):
+            if status == 429:
+                window.remaining = 0
+            return
+        window.limit = limit
+        # Other requests may have taken calls since this one was sent, so never raise the count above ours
+        window.remaining = min(window.remaining, remaining) if reset == window.reset else remaining
+        window.reset = reset
+        if status == 429:
+            window.remaining = 0
+
+# Error code and message of an error payload, e.g. {'errors': [{'code': 34, 'message': '...'}]} or
+# {'error': 'Not authorized.'}. The code is None when the payload has none
+def error_details(payload):
+    if isinstance(payload, dict):
+        errors = payload.get('errors')
+        if isinstance(errors, list) and errors and isinstance(errors[0], dict):
+            return errors[0].get('code'), errors[0].get('message')
+        if isinstance(payload.get('error'), str):
+            return None, payload['error']
+    return None, None
+
+# Response of a failed request, kept as the response of its TweepError the way tweepy keeps requests' response
+class ErrorResponse(object):
+
+    def __init__(self, status_code, headers, payload):
+        self.status_code = status_code
+        self.headers = headers
+        self.payload = payload
+
+# Default transport, signs requests with each credential's OAuth keys and runs them on a thread pool
+class RequestsTransport(object):
+
+    def __init__(self, keys_dicts, timeout=30):
+        self.timeout = timeout
+        self.sessions = []
+        for keys_dict in keys_dicts:
+            auth = tweepy.OAuthHandler(keys_dict['consumer_key'], keys_dict['consumer_secret'])
+            auth.set_access_token(keys_dict['access_token_key'], keys_dict['access_token_secret'])
+            session = requests.Session()
+            session.auth = auth.apply_auth()
+            self.sessions.append(session)
+
+    async def __call__(self, credential, endpoint, params):
+        loop = asyncio.get_running_loop()
+        get = partial(self.sessions[credential].get, API_ROOT + endpoint + '.json', params=params, timeout=self.timeout)
+        response = await loop.run_in_executor(None, get)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        return response.status_code, response.headers, payload
+
+class AsyncTweetMiner(object):
+
+    # keys_dicts is a list of credential dicts in the TweetMiner format. transport is an async callable
+    # (credential, endpoint, params) -> (status code, headers, JSON payload), by default the Twitter API. A request
+    # the transport fails to send (a connection error or a timeout) is retried up to retries times, waiting backoff
+    # seconds and twice as long after every further failure
+    def __init__(self, keys_dicts, result_limit=20, concurrency=16, transport=None, count_entities=False,
+                 clock=time.time, sleep=asyncio.sleep, retries=3, backoff=1.):
+        if isinstance(keys_dicts, dict):
+            keys_dicts = [keys_dicts]
+        self.result_limit = result_limit
+        self.count_entities = count_entities
+        self.transport = transport if transport is not None else RequestsTransport(keys_dicts)
+        self.limiter = RateLimiter(len(keys_dicts), clock, sleep)
+        self.concurrency = concurrency
+        self.semaphore = None
+        self.requests = {}
+        self.sleep = sleep
+        self.retries = retries
+        self.backoff = backoff
+
+    # One API call, retried after the window resets if the API still answers 429. A request that cannot be sent
+    # raises TweepError once its retries are used up, so one query failing does not cancel the others
+    async def request(self, endpoint, params):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        failures = 0
+        while True:
+            credential = await self.limiter.acquire(endpoint)
+            async with self.semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await self.transport(credential, endpoint, params)
+                except (requests.RequestException, OSError, asyncio.TimeoutError) as e:
+                    response = None
+                    error = e
+                pipelineMetrics.observe_request(endpoint, time.perf_counter() - start)
+            if response is None:
+                failures += 1
+                if failures > self.retries:
+                    raise TweepError('Failed to send request: ' + str(error))
+                print('Request to ' + endpoint + ' failed, retrying: ' + str(error))
+                await self.sleep(self.backoff * 2 ** (failures - 1))
+                continue
+            status, headers, payload = response
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.limiter.update(credential, endpoint, headers, status)
+            if status == 429:
+                pipelineMetrics.count('rate_limited_responses')
+                continue
+            if status >= 400:
+                api_code, message = error_details(payload)
+                reason = 'Twitter error response: status code = ' + str(status)
+                if message:
+                    reason += ', ' + message
+                raise TweepError(reason, ErrorResponse(status, headers, payload), api_code=api_code)
+            return payload
+
+    # Formatted and raw information of one user, looked up by kind ('user_id' or 'screen_name'), None if not found
+    async def user_info(self, kind, name):
+        try:
+            user = await self.request('users/show', {kind: name})
+        except TweepError:
+            return None
+        return format_user(user), user
+
+    # Same results as TweetMiner.mine_user_info with the raw JSON payloads as raw data, all users queried at once.
+    # User ids and screen names are given separately, a screen name may be all digits. Results are ids first
+    async def mine_user_info(self, user_ids=[], screen_names=[]):
+        data = []
+        raw_data = []
+        usersnotfound = 0
+        lookups = [self.user_info('user_id', name) for name in user_ids]
+        lookups += [self.user_info('screen_name', name) for name in screen_names]
+        for result in await asyncio.gather(*lookups):
+            if result is None:
+                usersnotfound += 1
+                continue
+            data.append(result[0])
+            raw_data.append(result[1])
+        return data, raw_data, usersnotfound
+
+    # Pages of one query as lists of formatted tweets, each page asks for tweets older than the last one of the
+    # previous page. Raw JSON goes to raw_sink (e.g. a tweetMiner.JSONLSink) if one is given
+    async def iter_pages(self, endpoint, params, max_pages, raw_sink=None):
+        last_tweet_id = False
+        page = 1
+        while page <= max_pages:
+            page_params = dict(params, count=self.result_limit, tweet_mode='extended')
+            if last_tweet_id:
+                page_params['max_id'] = last_tweet_id - 1
+            try:
+                statuses = await self.request(endpoint, page_params)
+            except TweepError:
+                break
+            if isinstance(statuses, dict):
+                statuses = statuses.get('statuses', [])
+            if not statuses:
+                break
+            if raw_sink is not None:
+                for status in statuses:
+                    raw_sink.write(status)
+            last_tweet_id = statuses[-1]['id']
+            yield [format_status(status, self.count_entities) for status in statuses], statuses
+            page += 1
+
+    def iter_topical_tweets(self, topic="", max_pages=5, raw_sink=None):
+        return self.formatted_pages(self.iter_pages('search/tweets', {'q': topic}, max_pages, raw_sink))
+
+    def iter_user_tweets(self, user="", max_pages=5, raw_sink=None):
+        return self.formatted_pages(self.iter_pages('statuses/user_timeline', {'screen_name': user}, max_pages, raw_sink))
+
+    async def formatted_pages(self, pages):
+        async for page_data, page_raw_data in pages:
+            yield page_data
+
+    async def mine_pages(self, endpoint, params, max_pages):
+        data = []
+        raw_data = []
+        async for page_data, page_raw_data in self.iter_pages(endpoint, params, max_pages):
+            data.extend(page_data)
+            raw_data.extend(page_raw_data)
+        return data, raw_data
+
+    async def mine_topical_tweets(self, topic="", max_pages=5):
+        return await self.mine_pages('search/tweets', {'q': topic}, max_pages)
+
+    async def mine_user_tweets(self, user="", max_pages=5):
+        return await self.mine_pages('statuses/user_timeline', {'screen_name': user}, max_pages)
+
+    # Mine many topics or users at once, data and raw data of all queries are returned in query order
+    async def mine_many(self, method, queries, max_pages):
+        data = []
+        raw_data = []
+        for query_data, query_raw_data in await asyncio.gather(*[method(query, max_pages) for query in queries]):
+            data.extend(query_data)
+            raw_data.extend(query_raw_data)
+        return data, raw_data
+
+    async def mine_topics(self, topics, max_pages=5):
+        return await self.mine_many(self.mine_topical_tweets, topics, max_pages)
+
+    async def mine_users_tweets(self, users, max_pages=5):
+        return await self.mine_many(self.mine_user_tweets, users, max_pages)
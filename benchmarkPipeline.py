@@ -0,0 +1,182 @@
+import argparse
+import multiprocessing
+import resource
+import time
+import numpy as np
+import pandas as pd
+try:
+    from . import textPreprocessing, tweetProcessing, userFeatureState
+except ImportError:
+    import textPreprocessing, tweetProcessing, userFeatureState
+
+# Offline benchmarks for the feature pipeline. synthetic_frames builds user and tweet frames with the columns the
+# feature functions expect after the Step3 cleaning: words drawn from a Zipf distributed vocabulary, per user
+# retweet ratios and English proportions, and bursty tweet times (sessions of quick tweets around each user's
+# favourite hour). Every benchmark runs in a forked child on fresh copies of the frames and reports its wall time,
+# tweets per second and the child's peak RSS, so one function's memory does not hide another's.
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'de', 'ba', 'ze', 'po', 'gu', 'fi', 'ha', 'jo']
+LANGUAGES = ['en', 'ru', 'es', 'de', 'fr']
+
+# Vocabulary of made up words, the most frequent first
+def synthetic_vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES, rng.integers(2, 5))))
+    return np.array(sorted(words, key=len))
+
+def synthetic_frames(n_users=1000, tweets_per_user=50, vocabulary_size=20000, zipf=1.2, words_per_tweet=12,
+                     seed=0):
+    rng = np.random.default_rng(seed)
+    vocabulary = synthetic_vocabulary(vocabulary_size, rng)
+    userids = np.array(['u' + str(user) for user in range(n_users)], dtype=object)
+    user_df = pd.DataFrame({
+        'userid': userids,
+        'user_reported_location': rng.integers(0, 2, n_users),
+        'user_profile_description': rng.integers(0, 2, n_users),
+        'follower_count': rng.zipf(1.8, n_users),
+        'following_count': rng.zipf(1.8, n_users),
+    })
+
+    # Tweet counts vary between users around tweets_per_user
+    counts = np.maximum(1, rng.lognormal(np.log(tweets_per_user), 0.8, n_users).astype('int64'))
+    n = counts.sum()
+    codes = np.repeat(np.arange(n_users), counts)
+
+    # Bursty times: sessions start around the user's favourite hour, tweets within a session are minutes apart
+    start = np.datetime64('2019-01-01').astype('datetime64[s]').astype('int64')
+    favourite_hour = rng.integers(0, 24, n_users)
+    new_session = rng.random(n) < 0.2
+    new_session[np.concatenate([[0], np.cumsum(counts)[:-1]])] = True
+    session_day = rng.integers(0, 365, n)
+    session_start = start + session_day * 86400 + (favourite_hour[codes] * 3600 + rng.normal(0, 5400, n)).astype('int64')
+    session_ids = np.cumsum(new_session) - 1
+    session_start = session_start[new_session][session_ids]
+    gaps = rng.exponential(180, n).astype('int64')
+    position = np.arange(n) - np.flatnonzero(new_session)[session_ids]
+    offsets = np.cumsum(gaps) - np.cumsum(gaps)[np.flatnonzero(new_session)][session_ids]
+    seconds = session_start + np.where(position > 0, offsets, 0)
+
+    retweet_ratio = rng.beta(2, 3, n_users)
+    english = rng.beta(5, 2, n_users)
+    is_retweet = (rng.random(n) < retweet_ratio[codes]).astype('int64')
+    language = np.where(rng.random(n) < english[codes], 'en', rng.choice(LANGUAGES[1:], n))
+
+    ranks = np.minimum(rng.zipf(zipf, (n, words_per_tweet)), vocabulary_size) - 1
+    words = vocabulary[ranks]
+    texts = [('RT @' + userids[code] + ' ' if retweet else '') + ' '.join(row)
+             for code, retweet, row in zip(codes, is_retweet, words)]
+
+    tweet_df = pd.DataFrame({
+        'tweetid': np.arange(n),
+        'userid': userids[codes],
+        'tweet_language': language,
+        'tweet_text': texts,
+        'tweet_time': pd.to_datetime(seconds, unit='s'),
+        'is_retweet': is_retweet,
+        'quote_count': rng.zipf(2.5, n) - 1,
+        'like_count': rng.zipf(1.8, n) - 1,
+        'retweet_count': rng.zipf(2, n) - 1,
+        'hashtags': rng.poisson(0.6, n),
+        'urls': rng.poisson(0.3, n),
+        'user_mentions': rng.poisson(0.8, n),
+    })
+    return user_df, tweet_df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+def with_bow(tweet_df):
+    # Stand-in BoW for the user level benchmarks, so they do not depend on the NLTK models
+    tweet_df = tweet_df.copy()
+    tweet_df['BoW'] = tweet_df['tweet_text'].str.split()
+    return tweet_df
+
+def preprocess_gensim_all(user_df, tweet_df):
+    for text in tweet_df['tweet_text']:
+        tweetProcessing.preprocess_gensim(text)
+
+def preprocess_texts(user_df, tweet_df):
+    textPreprocessing.preprocess_texts(list(tweet_df['tweet_text']), processes=1)
+
+def feature_state(user_df, tweet_df):
+    state = userFeatureState.UserFeatureState(user_df['userid'])
+    state.update(tweet_df)
+    state.apply(user_df, toList=True)
+
+# name -> (function(user_df, tweet_df), whether it needs a BoW column, whether it is a per user loop)
+BENCHMARKS = {
+    'preprocess_gensim':      (preprocess_gensim_all, False, False),
+    'preprocess_texts':       (preprocess_texts, False, False),
+    'process_users':          (lambda u, t: tweetProcessing.process_users(u, t, False), True, True),
+    'retweetRatio':           (tweetProcessing.retweetRatio, False, True),
+    'englishRatio':           (tweetProcessing.englishRatio, False, True),
+    'tweet_time_statistics':  (lambda u, t: tweetProcessing.tweet_time_statistics(t, u, en=True, non=True), False, True),
+    'averageTweetNum':        (tweetProcessing.averageTweetNum, False, True),
+    'avgTweetMetrics':        (tweetProcessing.avgTweetMetrics, False, True),
+    'patternOfLife':          (tweetProcessing.patternOfLife, False, False),
+    'tweetRateStatistics':    (tweetProcessing.tweetRateStatistics, False, False),
+    'UserFeatureState':       (feature_state, True, False),
+}
+
+def run_benchmark(name, user_df, tweet_df, results):
+    function, needs_bow, per_user = BENCHMARKS[name]
+    if needs_bow:
+        tweet_df = with_bow(tweet_df)
+    user_df = user_df.copy()
+    tweet_df = tweet_df.copy()
+    start = time.perf_counter()
+    try:
+        function(user_df, tweet_df)
+        error = None
+    except Exception as e:
+        # e.g. a LookupError when the NLTK data is not installed, whose message is framed by lines of stars
+        lines = [line.strip() for line in str(e).split('\n') if line.strip().strip('*')]
+        error = type(e).__name__ + ': ' + (lines[0] if lines else '')
+    elapsed = time.perf_counter() - start
+    results.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, error))
+
+# Run a benchmark in a forked child and return (seconds, peak RSS in MB, error or None)
+def isolated(name, user_df, tweet_df):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=run_benchmark, args=(name, user_df, tweet_df, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+# Time every benchmark at every scale, a scale being (users, tweets per user). Per user loops are skipped above
+# max_loop_tweets tweets, since they grow with users x tweets
+def run(scales, names=None, max_loop_tweets=200000, seed=0, verbose=True):
+    names = list(BENCHMARKS) if names is None else names
+    rows = []
+    for n_users, tweets_per_user in scales:
+        user_df, tweet_df = synthetic_frames(n_users, tweets_per_user, seed=seed)
+        for name in names:
+            if BENCHMARKS[name][2] and len(tweet_df) > max_loop_tweets:
+                continue
+            seconds, peak_rss, error = isolated(name, user_df, tweet_df)
+            row = {'function': name, 'users': n_users, 'tweets': len(tweet_df), 'seconds': seconds,
+                   'tweets_per_sec': len(tweet_df) / seconds if seconds > 0 else np.nan, 'peak_rss_mb': peak_rss,
+                   'error': error}
+            rows.append(row)
+            if verbose:
+                print(name + ' ' + str(n_users) + ' users, ' + str(len(tweet_df)) + ' tweets: ' +
+                      (error if error else str(round(seconds, 3)) + ' s, ' + str(int(row['tweets_per_sec'])) +
+                       ' tweets/s, ' + str(int(peak_rss)) + ' MB'))
+    return pd.DataFrame(rows)
+
+def parse_scale(scale):
+    users, tweets = scale.lower().split('x')
+    return int(users), int(tweets)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the feature pipeline on synthetic tweets')
+    parser.add_argument('--scales', nargs='+', default=['100x50', '1000x50', '10000x50'],
+                        help='users x tweets per user, e.g. 1000x50')
+    parser.add_argument('--functions', nargs='+', choices=list(BENCHMARKS))
+    parser.add_argument('--max-loop-tweets', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='CSV file for the results')
+    args = parser.parse_args()
+    results = run([parse_scale(scale) for scale in args.scales], args.functions, args.max_loop_tweets, args.seed)
+    if args.output:
+        results.to_csv(args.output, index=False)
@@ -0,0 +1,133 @@
+import pandas as pd
+import numpy as np
+from numpy import NaN
+from math import atan2
+
+# Vectorized time of day statistics for every user at once. Times are read straight from the datetime64
+# nanoseconds and each statistic is a bincount or a sorted segment lookup over user codes, which are the
+# position of each tweet's user in the list of unique users. Results match tweet_time_statistics in
+# tweetProcessing, including the hhmm integer formatting of angle_to_time.
+
+MINUTE = 60 * 10**9
+DAY = 24 * 60 * 60
+
+# Hour and minute of day of a datetime64 column, NaT rows are returned as -1
+def hours_minutes(tweet_time):
+    tweet_time = pd.Series(tweet_time)
+    if getattr(tweet_time.dt, 'tz', None) is not None:
+        tweet_time = tweet_time.dt.tz_localize(None)
+    stamps = tweet_time.to_numpy(dtype='datetime64[ns]')
+    missing = np.isnat(stamps)
+    minutes_of_day = (stamps.astype('int64') // MINUTE) % (24 * 60)
+    hours, minutes = np.divmod(minutes_of_day, 60)
+    hours[missing] = -1
+    minutes[missing] = -1
+    return hours, minutes
+
+# Clock time in degrees, the same as time_to_angle
+def times_to_angles(hours, minutes):
+    return (minutes * 60 + hours * 3600) * 360. / DAY
+
+# Vectorized angle_to_time, keeps the unpadded minute formatting of the original
+def angles_to_times(angles):
+    angles = np.asarray(angles, dtype='float64')
+    seconds = angles * DAY / 360.
+    seconds = np.where(seconds < 0, seconds + DAY, seconds)
+    h, m = np.divmod(seconds, 3600)
+    m = m // 60
+    return np.where(m < 10, h * 10 + m, h * 100 + m)
+
+# Columns that only hold whole numbers go back to int when no user is missing a value
+def int_if_complete(values):
+    if np.isnan(values).any():
+        return values
+    return values.astype('int64')
+
+# Earliest, latest, mean, median and standard deviation of the time of day, tweet count and hour modes for
+# each of n users. codes, hours and minutes are aligned arrays of the tweets to use, returns a dict of columns.
+# weights gives the number of tweets each entry stands for, so a per-user minute of day histogram can be used
+# in place of the tweets themselves
+def segment_time_statistics(codes, hours, minutes, n, weights=None):
+    codes = np.asarray(codes, dtype='int64')
+    hours = np.asarray(hours, dtype='int64')
+    minutes = np.asarray(minutes, dtype='int64')
+    if weights is None:
+        weights = np.ones(len(codes), dtype='int64')
+    weights = np.asarray(weights, dtype='int64')
+    times = hours * 100 + minutes
+    angles = times_to_angles(hours, minutes)
+
+    counts = np.bincount(codes, weights=weights, minlength=n).astype('int64')
+    timed = counts > 0
+    ends = np.cumsum(counts)
+    starts = ends - counts
+
+    # Sorting by user then angle puts every user's tweets in one run ordered by time of day. A tweet position
+    # is found through the running tweet count, users without tweets point at a padding slot past the end
+    order = np.lexsort((angles, codes))
+    sorted_times = np.append(times[order], 0)
+    sorted_angles = np.append(angles[order], 0.)
+    cumulative = np.cumsum(weights[order])
+    total = cumulative[-1] if len(cumulative) else 0
+
+    def at(positions):
+        return np.searchsorted(cumulative, np.where(timed, positions, total), side='right')
+
+    earliest = np.where(timed, sorted_times[at(starts)], NaN)
+    latest = np.where(timed, sorted_times[at(ends - 1)], NaN)
+    lower = sorted_angles[at(starts + (counts - 1) // 2)]
+    upper = sorted_angles[at(starts + counts // 2)]
+    median_angles = np.where(timed, (lower + upper) / 2, NaN)
+
+    # Circular mean from the average unit vector, math.atan2 runs once per user since np.arctan2 can round
+    # differently from cmath.phase on whole minutes
+    radians = np.radians(angles)
+    sin_mean = np.divide(np.bincount(codes, weights=np.sin(radians) * weights, minlength=n), counts, out=np.zeros(n), where=timed)
+    cos_mean = np.divide(np.bincount(codes, weights=np.cos(radians) * weights, minlength=n), counts, out=np.zeros(n), where=timed)
+    mean_angles = np.frompyfunc(atan2, 2, 1)(sin_mean, cos_mean).astype('float64')
+
+    # Population standard deviation of the angles, two passes to stay close to statistics.pstdev
+    angle_means = np.divide(np.bincount(codes, weights=angles * weights, minlength=n), counts, out=np.zeros(n), where=timed)
+    squares = np.bincount(codes, weights=(angles - angle_means[codes]) ** 2 * weights, minlength=n)
+    stddev_angles = np.sqrt(np.divide(squares, counts, out=np.zeros(n), where=timed))
+
+    hour_counts = np.bincount(codes * 24 + hours, weights=weights, minlength=n * 24).reshape(n, 24)
+    modes = (hour_counts == hour_counts.max(axis=1, keepdims=True)).astype('float64')
+    modes[~timed] = NaN
+
+    statistics = {
+        'earliest_tweet_time': earliest,
+        'latest_tweet_time': latest,
+        'average_tweet_time': np.where(timed, angles_to_times(np.degrees(mean_angles)), NaN),
+        'median_tweet_time': angles_to_times(median_angles),
+        'tweet_count': np.where(timed, counts, NaN),
+        'stddev_tweet_time': np.where(timed, angles_to_times(stddev_angles), NaN),
+    }
+    for k in range(24):
+        statistics["mode_" + str(k)] = modes[:, k]
+    return {column: int_if_complete(values) for column, values in statistics.items()}
+
+# Tweets with a usable time that are in the selected languages
+def time_statistics_mask(tweet_df, en=True, non=False):
+    tweet_time = tweet_df.loc[:,'tweet_time']
+    selected = (tweet_time.notna() & (tweet_time != '1900-01-01 00:00')).to_numpy()
+    if en and not non:
+        selected &= (tweet_df.loc[:,'tweet_language'] == 'en').to_numpy()
+    elif non and not en:
+        selected &= (tweet_df.loc[:,'tweet_language'] != 'en').to_numpy()
+    return selected
+
+# Drop in replacement for tweetProcessing.tweet_time_statistics, tweet_time must already be datetime64
+def tweet_time_statistics(tweet_df, user_df, en=True, non=False):
+    if not en and not non:
+        print("tweet_time_statistics_error: one or both en/non must be true")
+        return
+    users = pd.Index(user_df.loc[:,'userid'].unique())
+    codes = users.get_indexer(tweet_df.loc[:,'userid'])
+    selected = time_statistics_mask(tweet_df, en, non) & (codes >= 0)
+    hours, minutes = hours_minutes(tweet_df.loc[:,'tweet_time'])
+    statistics = segment_time_statistics(codes[selected], hours[selected], minutes[selected], len(users))
+
+    rows = users.get_indexer(user_df.loc[:,'userid'])
+    for column, values in statistics.items():
+        user_df.loc[:,column] = values[rows]
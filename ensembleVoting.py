@@ -0,0 +1,77 @@
+import numpy as np
+
+# Ensemble voting over any number of models. The predictions of all models are stacked into one (models, samples)
+# array of label codes and the weighted votes for every label are counted with a single bincount, so voting on
+# millions of users is one array operation instead of a statistics.mode call per user.
+#
+# Ties are broken by tie:
+#   'first'  the tied label voted for by the earliest model in the list, which is what statistics.mode gives
+#   'low'    the smallest tied label
+#   'high'   the largest tied label
+#   a label  that label whenever it is one of the tied labels, otherwise 'first'
+
+# Labels and (models, samples) label codes of a list of prediction arrays
+def stack_votes(predictions):
+    votes = np.vstack([np.asarray(prediction).ravel() for prediction in predictions])
+    labels, codes = np.unique(votes, return_inverse=True)
+    return labels, codes.reshape(votes.shape)
+
+def model_weights(weights, n_models):
+    if weights is None:
+        return np.ones(n_models)
+    weights = np.asarray(weights, dtype='float64')
+    if len(weights) != n_models:
+        raise ValueError('ensembleVoting: got ' + str(len(weights)) + ' weights for ' + str(n_models) +
+                         ' models, give one weight per model')
+    return weights
+
+# Index into the label axis of the winning label for every sample, scores is a (labels, samples) array
+def break_ties(scores, codes, labels, tie='first'):
+    n_samples = scores.shape[1]
+    samples = np.arange(n_samples)
+    tied = scores == scores.max(axis=0)
+    if tie == 'low':
+        return tied.argmax(axis=0)
+    if tie == 'high':
+        return len(labels) - 1 - tied[::-1].argmax(axis=0)
+    # The first model whose vote is one of the tied labels
+    model_tied = tied[codes, samples]
+    winner = codes[model_tied.argmax(axis=0), samples]
+    if tie != 'first':
+        preferred = np.searchsorted(labels, tie)
+        if preferred < len(labels) and labels[preferred] == tie:
+            winner = np.where(tied[preferred] & (tied.sum(axis=0) > 1), preferred, winner)
+    return winner
+
+# Weighted hard vote, predictions is a list of label arrays, one per model
+def majority_vote(predictions, weights=None, tie='first'):
+    labels, codes = stack_votes(predictions)
+    n_models, n_samples = codes.shape
+    weights = model_weights(weights, n_models)
+    keys = (codes * n_samples + np.arange(n_samples)).ravel()
+    scores = np.bincount(keys, weights=np.repeat(weights, n_samples), minlength=len(labels) * n_samples)
+    scores = scores.reshape(len(labels), n_samples)
+    return labels[break_ties(scores, codes, labels, tie)]
+
+# Weighted soft vote, probabilities is a list of (samples, classes) predict_proba arrays with the same classes
+# order, classes gives the labels of the columns (e.g. model.classes_), otherwise column indices are returned
+def soft_vote(probabilities, weights=None, classes=None, tie='low'):
+    stacked = np.stack([np.asarray(probability, dtype='float64') for probability in probabilities])
+    weights = model_weights(weights, len(stacked))
+    averaged = np.tensordot(weights, stacked, axes=1) / weights.sum()
+    if classes is None:
+        classes = np.arange(averaged.shape[1])
+    classes = np.asarray(classes)
+    codes = np.argmax(stacked, axis=2)
+    if not isinstance(tie, str) or tie not in ('first', 'low', 'high'):
+        matches = np.flatnonzero(classes == tie)
+        tie = int(matches[0]) if len(matches) else 'first'
+    winner = break_ties(averaged.T, codes, np.arange(len(classes)), tie)
+    return classes[winner], averaged
+
+# Predictions or class probabilities of a list of fitted models, inputs holds each model's feature matrix
+# (text models and pattern of life models take different inputs)
+def model_votes(models, inputs, proba=False):
+    if proba:
+        return [model.predict_proba(X) for model, X in zip(models, inputs)]
+    return [model.predict(X) for model, X in zip(models, inputs)]
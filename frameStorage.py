@@ -0,0 +1,45 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Parquet storage for the tweet and user frames passed between the notebook steps. Columns keep their types on
+# disk, so a reload does not have to parse BoW, hashtag or url lists back out of their string form: BoW is a
+# list<string>, the language and client columns are dictionary encoded and tweet_time is a timestamp.
+
+CATEGORY_COLUMNS = ['tweet_language', 'account_language', 'tweet_client_name']
+TIME_COLUMNS = ['tweet_time', 'account_creation_date']
+LIST_COLUMNS = ['BoW']
+
+# Column types used on disk, only columns present in the frame are changed
+def typed_frame(df):
+    df = df.copy()
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    for column in TIME_COLUMNS:
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    for column in LIST_COLUMNS:
+        # Joined BoW strings from process_users(toList=False) are stored as they are
+        if column in df.columns and df[column].map(lambda x: isinstance(x, list)).any():
+            df[column] = df[column].map(lambda x: x if isinstance(x, list) else None)
+    return df
+
+# Write a tweet or user frame to a compressed Parquet file
+def save_frame(df, path, compression='zstd', row_group_size=1000000):
+    table = pa.Table.from_pandas(typed_frame(df), preserve_index=False)
+    pq.write_table(table, path, compression=compression, row_group_size=row_group_size)
+
+# Read a frame written by save_frame. columns reads only those columns, filters is passed to pyarrow to skip
+# row groups, e.g. [('info_op', '=', 1)]. List columns come back as Python lists, as process_tweets makes them
+def load_frame(path, columns=None, filters=None):
+    table = pq.read_table(path, columns=columns, filters=filters)
+    df = table.to_pandas(ignore_metadata=True)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            df[field.name] = pd.Series(table.column(i).to_pylist(), index=df.index, dtype='object')
+    return df
+
+# Column names stored in a file, without reading any data
+def frame_columns(path):
+    return pq.read_schema(path).names
@@ -0,0 +1,138 @@
+import json
+import os
+import time
+import tweepy
+try:
+    from .tweetMiner import format_status, transient_error
+except ImportError:
+    from tweetMiner import format_status, transient_error
+
+# Resumable mining jobs around TweetMiner. Every fetched page is appended to a JSONL checkpoint file as one line
+# holding the query, the page number, the max_id cursor for the next page and the raw statuses, and is flushed to
+# disk before the next request. A job started again with the same file reads the lines back, skips the pages it
+# already has and continues each query from its stored cursor, so no quota is spent twice on the same page.
+# The formatted rows are rebuilt from the stored statuses, so they are the same as the TweetMiner methods give.
+# A query is exhausted once a page comes back empty, and a job run again with a larger max_pages continues the
+# queries that only stopped at the page cap. A query whose request fails for good (a protected, suspended or deleted
+# account) ends there and is recorded as exhausted with the error. A transient failure (a server or connection
+# error) is retried up to retries times with exponential backoff and then raised, nothing is written for it.
+
+TOPIC = 'topic'
+USER = 'user'
+
+class MiningJob(object):
+
+    def __init__(self, miner, path, max_pages=5, retries=3, backoff=1.):
+        self.miner = miner
+        self.path = path
+        self.max_pages = max_pages
+        self.retries = retries
+        self.backoff = backoff
+        self.cursors = {}
+        self.load()
+
+    # Cursor of every query in the checkpoint file. A line cut short by a crash is ignored, its page is fetched again
+    def load(self):
+        self.cursors = {}
+        for record in self.records():
+            self.cursors[(record['kind'], record['query'])] = {
+                'page': record['page'],
+                'max_id': record['max_id'],
+                'exhausted': record['exhausted'],
+            }
+
+    def records(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def append(self, record):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def fetch_page(self, kind, query, max_id):
+        params = {'count': self.miner.result_limit, 'tweet_mode': 'extended', 'include_retweets': True}
+        if max_id:
+            params['max_id'] = max_id
+        if kind == TOPIC:
+            return self.miner.call('search', self.miner.api.search, q=query, **params)
+        return self.miner.call('user_timeline', self.miner.api.user_timeline, screen_name=query, **params)
+
+    # Mine the pages of one query that are not in the checkpoint file yet
+    def run_query(self, kind, query):
+        cursor = self.cursors.get((kind, query), {'page': 0, 'max_id': None, 'exhausted': False})
+        if cursor['exhausted'] or cursor['page'] >= self.max_pages:
+            return
+        print('Mining ', query)
+        page = cursor['page'] + 1
+        max_id = cursor['max_id']
+        failures = 0
+        while page <= self.max_pages:
+            try:
+                statuses = self.fetch_page(kind, query, max_id)
+            except tweepy.error.RateLimitError:
+                print('15 minute query limit reached, wait 15 minutes until query resumes')
+                print(str(page - 1) + ' pages of ' + str(self.max_pages) + ' total pages have been queried')
+                self.miner.rate_limit_wait('search' if kind == TOPIC else 'user_timeline')
+                print('Query resumed')
+                continue
+            except tweepy.error.TweepError as e:
+                if not transient_error(e):
+                    print('Query failed for ' + query + ': ' + str(e))
+                    self.append({'kind': kind, 'query': query, 'page': page, 'max_id': max_id, 'exhausted': True,
+                                 'error': str(e), 'statuses': []})
+                    self.cursors[(kind, query)] = {'page': page, 'max_id': max_id, 'exhausted': True}
+                    break
+                failures += 1
+                if failures > self.retries:
+                    raise
+                print('Query failed for ' + query + ', retrying: ' + str(e))
+                time.sleep(self.backoff * 2 ** (failures - 1))
+                continue
+            failures = 0
+            print('    Mining ' + str(page) + ' of ' + str(self.max_pages) + ' total pages')
+            raw = [status._json for status in statuses]
+            if raw:
+                max_id = raw[-1]['id'] - 1
+            exhausted = not raw
+            self.append({'kind': kind, 'query': query, 'page': page, 'max_id': max_id, 'exhausted': exhausted,
+                         'statuses': raw})
+            self.cursors[(kind, query)] = {'page': page, 'max_id': max_id, 'exhausted': exhausted}
+            if exhausted:
+                break
+            page += 1
+
+    # Formatted and raw tweets of the given queries in query and page order, read back from the checkpoint file.
+    # Raw tweets are the statuses' JSON dicts
+    def results(self, kind, queries):
+        pages = {}
+        for record in self.records():
+            if record['kind'] == kind and record['query'] in queries:
+                pages[(record['query'], record['page'])] = record['statuses']
+        data = []
+        raw_data = []
+        for query in queries:
+            page = 1
+            while (query, page) in pages:
+                for status in pages[(query, page)]:
+                    data.append(format_status(status, self.miner.count_entities))
+                    raw_data.append(status)
+                page += 1
+        return data, raw_data
+
+    def mine_topics(self, topics):
+        for topic in topics:
+            self.run_query(TOPIC, topic)
+        return self.results(TOPIC, topics)
+
+    def mine_users_tweets(self, users):
+        for user in users:
+            self.run_query(USER, user)
+        return self.results(USER, users)
@@ -0,0 +1,139 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import joblib
+import numpy as np
+import sklearn
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+# Versioned on-disk store for the fitted vectorizers and classifiers of Step4. Each save of a model set makes a new
+# directory <root>/<name>/v<version> holding one file per artifact and a manifest.json with the artifact kinds, the
+# feature schema the models were trained on and any metadata. Count and TF-IDF vectorizers are stored as their
+# parameters plus the vocabulary and idf as arrays, which is smaller and faster to load than a pickled dict.
+# Classifiers are stored uncompressed with joblib and loaded with mmap_mode, so their NumPy arrays are mapped from
+# disk instead of read and copied. A GridSearchCV is stored as its best_estimator_ with best_params_ in the manifest.
+
+VECTORIZERS = {'CountVectorizer': CountVectorizer, 'TfidfVectorizer': TfidfVectorizer}
+
+# Column names and dtypes of a feature frame, the schema recorded with a model set
+def frame_schema(df, columns=None):
+    if columns is None:
+        columns = list(df.columns)
+    return [{'name': column, 'dtype': str(df[column].dtype)} for column in columns]
+
+# Columns of the schema that a frame is missing
+def missing_columns(df, schema):
+    return [column['name'] for column in schema if column['name'] not in df.columns]
+
+# Vectorizer parameters as JSON, None if the vectorizer uses callables and has to be pickled instead
+def vectorizer_params(vectorizer):
+    params = vectorizer.get_params()
+    params['dtype'] = np.dtype(params['dtype']).name
+    for value in params.values():
+        if callable(value):
+            return None
+    return params
+
+def save_vectorizer(vectorizer, path):
+    tokens = np.empty(len(vectorizer.vocabulary_), dtype=object)
+    for token, column in vectorizer.vocabulary_.items():
+        tokens[column] = token
+    arrays = {'tokens': tokens.astype(str)}
+    if getattr(vectorizer, 'idf_', None) is not None:
+        arrays['idf'] = vectorizer.idf_
+    np.savez(path, **arrays)
+
+def load_vectorizer(kind, params, path):
+    params = dict(params)
+    params['dtype'] = np.dtype(params['dtype']).type
+    if isinstance(params.get('ngram_range'), list):
+        params['ngram_range'] = tuple(params['ngram_range'])
+    vectorizer = VECTORIZERS[kind](**params)
+    stored = np.load(path)
+    tokens = stored['tokens'].tolist()
+    vectorizer.vocabulary_ = dict(zip(tokens, range(len(tokens))))
+    vectorizer.fixed_vocabulary_ = params.get('vocabulary') is not None
+    if 'idf' in stored:
+        vectorizer.idf_ = stored['idf']
+    return vectorizer
+
+class ModelRegistry(object):
+
+    def __init__(self, root):
+        self.root = root
+
+    def versions(self, name):
+        path = os.path.join(self.root, name)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(entry[1:]) for entry in os.listdir(path) if entry.startswith('v') and entry[1:].isdigit())
+
+    def path(self, name, version):
+        return os.path.join(self.root, name, 'v' + str(version))
+
+    # Save a dict of artifact name -> fitted vectorizer or model as the next version of name. feature_schema is
+    # e.g. frame_schema(user_df, FEATURE_COLUMNS), metadata any JSON, such as which vectorizer feeds which model.
+    # The version is written to a temporary directory and renamed into place, so a reader never sees half of it
+    def save(self, name, artifacts, feature_schema=None, metadata=None):
+        os.makedirs(os.path.join(self.root, name), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=os.path.join(self.root, name))
+        manifest = {
+            'name': name,
+            'created': datetime.datetime.utcnow().isoformat(),
+            'sklearn_version': sklearn.__version__,
+            'feature_schema': feature_schema,
+            'metadata': metadata,
+            'artifacts': {},
+        }
+        for key, artifact in artifacts.items():
+            entry = {'class': type(artifact).__name__}
+            if hasattr(artifact, 'best_estimator_'):
+                entry['best_params'] = {param: repr(value) for param, value in artifact.best_params_.items()}
+                artifact = artifact.best_estimator_
+                entry['class'] = type(artifact).__name__
+            params = vectorizer_params(artifact) if type(artifact).__name__ in VECTORIZERS else None
+            if params is not None:
+                entry.update({'kind': 'vectorizer', 'params': params, 'file': key + '.npz'})
+                save_vectorizer(artifact, os.path.join(staging, entry['file']))
+            else:
+                entry.update({'kind': 'joblib', 'file': key + '.joblib'})
+                joblib.dump(artifact, os.path.join(staging, entry['file']))
+            manifest['artifacts'][key] = entry
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        # Take the next free version number, another process may have saved one meanwhile
+        while True:
+            version = (self.versions(name) or [0])[-1] + 1
+            try:
+                os.rename(staging, self.path(name, version))
+                break
+            except OSError:
+                if not os.path.exists(self.path(name, version)):
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise
+        return version
+
+    def manifest(self, name, version=None):
+        if version is None:
+            version = self.versions(name)[-1]
+        with open(os.path.join(self.path(name, version), 'manifest.json')) as f:
+            manifest = json.load(f)
+        manifest['version'] = version
+        return manifest
+
+    # Artifacts of a version (the latest by default) as a dict, and its manifest. keys loads only those artifacts
+    def load(self, name, version=None, keys=None, mmap_mode='r'):
+        manifest = self.manifest(name, version)
+        path = self.path(name, manifest['version'])
+        artifacts = {}
+        for key, entry in manifest['artifacts'].items():
+            if keys is not None and key not in keys:
+                continue
+            if entry['kind'] == 'vectorizer':
+                artifacts[key] = load_vectorizer(entry['class'], entry['params'], os.path.join(path, entry['file']))
+            else:
+                artifacts[key] = joblib.load(os.path.join(path, entry['file']), mmap_mode=mmap_mode)
+        return artifacts, manifest
@@ -0,0 +1,173 @@
+import math
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from sklearn.naive_bayes import MultinomialNB
+
+# Successive halving search over a parameter grid, a faster replacement for the GridSearchCV runs of Step4. The
+# cross validation folds are sliced out of the vectorized matrix once (FoldCache) and every config is fitted on the
+# same cached slices. All configs start on a small subsample of each training fold, and only the best of them move
+# on to a subsample factor times larger, until about factor survivors are fitted on the full folds. Fits run on
+# a joblib process pool, which memory maps the large fold arrays instead of copying them to every worker. The
+# final rung uses the same folds as GridSearchCV(cv=5), so its scores are the scores GridSearchCV would report.
+
+# Step4's grids. SGD's penalty "none" is None in current scikit-learn
+SGD_GRID = {
+    'alpha': [0.0001, 0.001, 0.01, 0.1, 1, 10, 100],
+    'penalty': [None, "l1", "l2"],
+    'eta0': [0.001, 0.01, 0.1, 1, 10, 100],
+    'learning_rate': ['constant', 'optimal', 'invscaling', 'adaptive'],
+}
+MNB_GRID = {
+    'alpha': np.linspace(0.5, 1.5, 6),
+    'fit_prior': [True, False],
+}
+
+# Cross validation folds of one feature matrix, with the training rows of every subsample size cached
+class FoldCache(object):
+
+    def __init__(self, X, y, cv=5, random_state=42):
+        self.X = X if sparse.issparse(X) else np.asarray(X)
+        self.y = np.asarray(y)
+        self.folds = []
+        self.subsets = {}
+        rng = np.random.RandomState(random_state)
+        for train, test in StratifiedKFold(cv).split(np.zeros(len(self.y)), self.y):
+            # Subsamples are prefixes of a random order, so a smaller subsample is part of every larger one
+            self.folds.append((train, rng.permutation(train), self.X[test], self.y[test]))
+        self.n_train = min(len(train) for train, order, X_test, y_test in self.folds)
+
+    # Training rows of a fold limited to n rows, the full fold in its original order when n is None or covers it.
+    # Folds can differ in size by a row, so the final rung asks for n=None rather than n_train
+    def train(self, fold, n=None):
+        train, order, X_test, y_test = self.folds[fold]
+        rows = train if n is None or n >= len(train) else np.sort(order[:n])
+        key = (fold, len(rows))
+        if key not in self.subsets:
+            self.subsets[key] = (self.X[rows], self.y[rows])
+        return self.subsets[key]
+
+    def test(self, fold):
+        train, order, X_test, y_test = self.folds[fold]
+        return X_test, y_test
+
+# Score, fit and score times of one config on one fold, and the error if it could not be fitted or scored. A config
+# that fails (e.g. a parameter combination the estimator rejects) gets error_score, or raises when it is 'raise'
+def fit_score(estimator, params, X_train, y_train, X_test, y_test, scoring, error_score=-np.inf):
+    start = time.perf_counter()
+    fit_time = 0.
+    try:
+        estimator = clone(estimator).set_params(**params)
+        estimator.fit(X_train, y_train)
+        fit_time = time.perf_counter() - start
+        score = get_scorer(scoring)(estimator, X_test, y_test)
+    except Exception as e:
+        if isinstance(error_score, str) and error_score == 'raise':
+            raise
+        return error_score, fit_time or time.perf_counter() - start, 0., type(e).__name__ + ': ' + str(e)
+    return score, fit_time, time.perf_counter() - start - fit_time, None
+
+# Subsample sizes of every rung, the last one being the full training folds
+def rung_sizes(n_configs, n_train, factor, min_resources):
+    n_rungs = max(1, math.ceil(math.log(n_configs, factor)) + 1) if n_configs > 1 else 1
+    sizes = [int(n_train / factor ** (n_rungs - 1 - rung)) for rung in range(n_rungs)]
+    return [size for size in sizes if size >= min_resources] or [n_train]
+
+class HalvingSearch(object):
+
+    # error_score is the score of a config that fails to fit on a fold, as in GridSearchCV, so one bad grid point
+    # drops out of the search instead of stopping it
+    def __init__(self, estimator, param_grid, factor=3, min_resources=100, scoring='accuracy', n_jobs=-1,
+                 refit=True, verbose=True, error_score=-np.inf):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.factor = factor
+        self.min_resources = min_resources
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.refit = refit
+        self.verbose = verbose
+        self.error_score = error_score
+
+    # Search on a FoldCache, or on X and y which are then split into folds of their own
+    def fit(self, X, y=None, cv=5):
+        folds = X if isinstance(X, FoldCache) else FoldCache(X, y, cv)
+        configs = list(ParameterGrid(self.param_grid))
+        candidates = list(range(len(configs)))
+        results = []
+        start = time.perf_counter()
+        with Parallel(n_jobs=self.n_jobs) as parallel:
+            sizes = rung_sizes(len(configs), folds.n_train, self.factor, self.min_resources)
+            # Rungs below min_resources are dropped, so eliminate faster to still end with about factor configs
+            elimination = self.factor
+            if len(sizes) > 1:
+                elimination = max(self.factor, (len(configs) / self.factor) ** (1. / (len(sizes) - 1)))
+            for rung, size in enumerate(sizes):
+                n = None if rung == len(sizes) - 1 else size
+                tasks = [(config, fold) for config in candidates for fold in range(len(folds.folds))]
+                scores = parallel(delayed(fit_score)(self.estimator, configs[config], *folds.train(fold, n),
+                                                     *folds.test(fold), self.scoring, self.error_score)
+                                  for config, fold in tasks)
+                by_config = {}
+                for (config, fold), (score, fit_time, score_time, error) in zip(tasks, scores):
+                    if error is not None:
+                        print('modelSearch_error: ' + str(configs[config]) + ' failed on fold ' + str(fold) + ', ' +
+                              error)
+                    by_config.setdefault(config, []).append((score, fit_time, score_time))
+                for config in candidates:
+                    fold_scores = np.array(by_config[config])
+                    results.append({
+                        'params': configs[config],
+                        'rung': rung,
+                        'n_resources': size,
+                        'mean_test_score': np.nanmean(fold_scores[:, 0]),
+                        'std_test_score': np.nanstd(fold_scores[:, 0]),
+                        'mean_fit_time': fold_scores[:, 1].mean(),
+                        'mean_score_time': fold_scores[:, 2].mean(),
+                        'total_time': fold_scores[:, 1:].sum(),
+                    })
+                if self.verbose:
+                    print('Rung ' + str(rung) + ': ' + str(len(candidates)) + ' configs on ' + str(size) +
+                          ' rows, ' + str(round(time.perf_counter() - start, 1)) + ' seconds so far')
+                if rung < len(sizes) - 1:
+                    rung_scores = np.array([result['mean_test_score'] for result in results[-len(candidates):]])
+                    keep = max(1, math.ceil(len(candidates) / elimination))
+                    # Stable ordering so equal scores keep grid order, as GridSearchCV's ranking does
+                    order = np.argsort(-np.nan_to_num(rung_scores, nan=-np.inf), kind='stable')[:keep]
+                    candidates = [candidates[i] for i in sorted(order)]
+
+        self.cv_results_ = pd.DataFrame(results)
+        final = self.cv_results_[self.cv_results_['rung'] == len(sizes) - 1]
+        best = final['mean_test_score'].to_numpy().argmax()
+        self.best_params_ = final['params'].iloc[best]
+        self.best_score_ = final['mean_test_score'].iloc[best]
+        self.search_time_ = time.perf_counter() - start
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(folds.X, folds.y)
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+# The four Bag of Words searches of Step4 (SGD and Multinomial Naive Bayes on TF-IDF and on counts). Each
+# vectorizer is fitted once on the training BoW strings and its folds are cached for both classifiers.
+# Returns the fitted vectorizers and a dict of search name -> HalvingSearch
+def step4_searches(X_BoW_train, y_BoW_train, factor=3, n_jobs=-1, verbose=True):
+    vectorizers = {'tfidf': TfidfVectorizer(), 'cv': CountVectorizer()}
+    searches = {}
+    for name, vectorizer in vectorizers.items():
+        folds = FoldCache(vectorizer.fit_transform(X_BoW_train), y_BoW_train)
+        for model_name, estimator, grid in [('mnb', MultinomialNB(), MNB_GRID),
+                                            ('sgd', SGDClassifier(random_state=42), SGD_GRID)]:
+            if verbose:
+                print('Searching ' + model_name + ' with ' + name)
+            searches[model_name + '_' + name] = HalvingSearch(estimator, grid, factor, n_jobs=n_jobs,
+                                                              verbose=verbose).fit(folds)
+    return vectorizers, searches
@@ -0,0 +1,288 @@
+import functools
+import inspect
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+# Opt-in instrumentation for the feature pipeline and the miners. Nothing is recorded until enable() is called: the
+# instrumented functions then check one module global and go straight to the original code, so the overhead when
+# disabled is a function call. When enabled, every stage records its calls, wall time, rows (tweets) processed and
+# the process peak RSS, counters record events such as text cache hits, and the miners record the latency of every
+# API request and the time spent waiting on rate limits. report() returns everything as a dict and prometheus()
+# as Prometheus text exposition format, which write() saves for a node_exporter textfile collector.
+#
+#     metrics = pipelineMetrics.enable()
+#     tweetProcessing.preprocess_frame(tweet_df, user_df)
+#     print(metrics.prometheus())
+
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+
+# Peak resident set size of the process in bytes, ru_maxrss is in kilobytes on Linux
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class StageStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.
+        self.max_seconds = 0.
+        self.rows = 0
+        self.peak_rss = 0
+        self.rss_growth = 0
+        self.peak_traced = 0
+
+class LatencyStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.
+        self.max_seconds = 0.
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+# A stage being timed. rows can be set inside the with block when the count is only known at the end
+class Stage(object):
+
+    def __init__(self, metrics, name, rows):
+        self.metrics = metrics
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.rss = peak_rss()
+        if self.metrics.trace_memory:
+            self.traced = self.metrics.push_traced()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        seconds = time.perf_counter() - self.start
+        traced = self.metrics.pop_traced() - self.traced if self.metrics.trace_memory else 0
+        self.metrics.record_stage(self.name, seconds, self.rows, self.rss, traced)
+        return False
+
+# Stand-in returned by stage() while metrics are disabled
+class NullStage(object):
+
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NULL_STAGE = NullStage()
+
+class PipelineMetrics(object):
+
+    # trace_memory also records each stage's peak Python allocations with tracemalloc, which is more precise than
+    # the process peak RSS but slows allocation heavy code down noticeably
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counters = {}
+        self.requests = {}
+        self.waits = {}
+        self.lock = threading.Lock()
+        self.traced_peaks = []
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def stage(self, name, rows=None):
+        return Stage(self, name, rows)
+
+    # Nested stages share tracemalloc's single peak: a stage keeps its parent's peak so far before resetting it,
+    # and hands its own peak back to the parent when it ends. Returns the memory traced at the start
+    def push_traced(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self.traced_peaks:
+            self.traced_peaks[-1] = max(self.traced_peaks[-1], peak)
+        tracemalloc.reset_peak()
+        self.traced_peaks.append(current)
+        return current
+
+    def pop_traced(self):
+        peak = max(self.traced_peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if self.traced_peaks:
+            self.traced_peaks[-1] = max(self.traced_peaks[-1], peak)
+        tracemalloc.reset_peak()
+        return peak
+
+    def record_stage(self, name, seconds, rows, rss_before, traced):
+        rss = peak_rss()
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.rows += rows or 0
+            stats.peak_rss = max(stats.peak_rss, rss)
+            stats.rss_growth += rss - rss_before
+            stats.peak_traced = max(stats.peak_traced, traced)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe_request(self, endpoint, seconds):
+        with self.lock:
+            if endpoint not in self.requests:
+                self.requests[endpoint] = LatencyStats()
+            self.requests[endpoint].observe(seconds)
+
+    def observe_wait(self, endpoint, seconds):
+        with self.lock:
+            waits, waited = self.waits.get(endpoint, (0, 0.))
+            self.waits[endpoint] = (waits + 1, waited + seconds)
+
+    def report(self):
+        with self.lock:
+            return {
+                'stages': {name: {
+                    'calls': stats.calls,
+                    'seconds': stats.seconds,
+                    'max_seconds': stats.max_seconds,
+                    'rows': stats.rows,
+                    'rows_per_second': stats.rows / stats.seconds if stats.rows and stats.seconds > 0 else None,
+                    'peak_rss_bytes': stats.peak_rss,
+                    'rss_growth_bytes': stats.rss_growth,
+                    'peak_traced_bytes': stats.peak_traced if self.trace_memory else None,
+                } for name, stats in self.stages.items()},
+                'counters': dict(self.counters),
+                'requests': {endpoint: {
+                    'count': stats.count,
+                    'seconds': stats.seconds,
+                    'mean_seconds': stats.seconds / stats.count,
+                    'max_seconds': stats.max_seconds,
+                } for endpoint, stats in self.requests.items()},
+                'rate_limit_waits': {endpoint: {'count': waits, 'seconds': waited}
+                                     for endpoint, (waits, waited) in self.waits.items()},
+            }
+
+    def prometheus(self, prefix='infoops'):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            if not samples:
+                return
+            lines.append('# HELP ' + prefix + '_' + name + ' ' + help_text)
+            lines.append('# TYPE ' + prefix + '_' + name + ' ' + kind)
+            for suffix, labels, value in samples:
+                label_text = ','.join(key + '="' + escape_label(str(label)) + '"' for key, label in labels)
+                lines.append(prefix + '_' + name + suffix + ('{' + label_text + '}' if label_text else '') + ' ' +
+                             repr(float(value)))
+
+        with self.lock:
+            stages = sorted(self.stages.items())
+            metric('stage_calls_total', 'counter', 'Calls of each pipeline stage',
+                   [('', [('stage', name)], stats.calls) for name, stats in stages])
+            metric('stage_seconds_total', 'counter', 'Wall time spent in each pipeline stage',
+                   [('', [('stage', name)], stats.seconds) for name, stats in stages])
+            metric('stage_rows_total', 'counter', 'Rows processed by each pipeline stage',
+                   [('', [('stage', name)], stats.rows) for name, stats in stages])
+            metric('stage_peak_rss_bytes', 'gauge', 'Process peak RSS at the end of each pipeline stage',
+                   [('', [('stage', name)], stats.peak_rss) for name, stats in stages])
+            metric('stage_rss_growth_bytes_total', 'counter', 'Growth of the process peak RSS during each stage',
+                   [('', [('stage', name)], stats.rss_growth) for name, stats in stages])
+            if self.trace_memory:
+                metric('stage_peak_traced_bytes', 'gauge', 'Peak Python allocations of each pipeline stage',
+                       [('', [('stage', name)], stats.peak_traced) for name, stats in stages])
+            for name, value in sorted(self.counters.items()):
+                metric(metric_name(name) + '_total', 'counter', 'Count of ' + name, [('', [], value)])
+
+            samples = []
+            for endpoint, stats in sorted(self.requests.items()):
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    samples.append(('_bucket', [('endpoint', endpoint), ('le', repr(bound))], count))
+                samples.append(('_bucket', [('endpoint', endpoint), ('le', '+Inf')], stats.count))
+                samples.append(('_sum', [('endpoint', endpoint)], stats.seconds))
+                samples.append(('_count', [('endpoint', endpoint)], stats.count))
+            metric('request_duration_seconds', 'histogram', 'Latency of Twitter API requests', samples)
+            waits = sorted(self.waits.items())
+            metric('rate_limit_waits_total', 'counter', 'Waits for a rate limit window to reset',
+                   [('', [('endpoint', endpoint)], count) for endpoint, (count, waited) in waits])
+            metric('rate_limit_wait_seconds_total', 'counter', 'Time spent waiting for rate limit windows',
+                   [('', [('endpoint', endpoint)], waited) for endpoint, (count, waited) in waits])
+        return '\n'.join(lines) + '\n'
+
+    # Write the Prometheus text to path, through a temporary file so a scraper never reads half of it
+    def write(self, path, prefix='infoops'):
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.prometheus(prefix))
+        os.replace(path + '.tmp', path)
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def metric_name(name):
+    return ''.join(c if c.isalnum() or c == '_' else '_' for c in name)
+
+# The active PipelineMetrics, None while disabled
+metrics = None
+
+def enable(trace_memory=False):
+    global metrics
+    metrics = PipelineMetrics(trace_memory)
+    return metrics
+
+def disable():
+    global metrics
+    if metrics is not None and metrics.started_tracing:
+        tracemalloc.stop()
+    metrics = None
+
+def stage(name, rows=None):
+    if metrics is None:
+        return NULL_STAGE
+    return metrics.stage(name, rows)
+
+def count(name, value=1):
+    if metrics is not None:
+        metrics.count(name, value)
+
+def observe_request(endpoint, seconds):
+    if metrics is not None:
+        metrics.observe_request(endpoint, seconds)
+
+def observe_wait(endpoint, seconds):
+    if metrics is not None:
+        metrics.observe_wait(endpoint, seconds)
+
+# Decorator timing every call of a function as a stage named after it. rows names the argument whose length is
+# the number of rows processed, e.g. the tweet frame
+def timed(function=None, name=None, rows='tweet_df'):
+    if function is None:
+        return functools.partial(timed, name=name, rows=rows)
+    name = name or function.__name__
+    parameters = list(inspect.signature(function).parameters)
+    position = parameters.index(rows) if rows in parameters else None
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if metrics is None:
+            return function(*args, **kwargs)
+        argument = None
+        if position is not None:
+            argument = args[position] if position < len(args) else kwargs.get(rows)
+        try:
+            n = len(argument) if argument is not None else None
+        except TypeError:
+            n = None
+        with metrics.stage(name, n):
+            return function(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,74 @@
+import pandas as pd
+import numpy as np
+from numpy import NaN
+
+# Tweet rate statistics for every user at once. pd.Grouper bins a user's tweets from the first to the last one,
+# empty bins included, so the average number of tweets per bin is the tweet count over the number of bins
+# between the first and last tweet. Nothing is resampled, so a window costs the same whatever its size.
+# Windows that divide a day evenly match pd.Grouper, '1W' uses Grouper's Monday to Sunday weeks.
+
+MINUTE = 60 * 10**9
+DAY = 24 * 60 * MINUTE
+
+# Column and pd.Grouper frequency of the windows averageTweetNum uses, extend with e.g. 'avg_tweets_per_5min': '5min'
+RATE_WINDOWS = {
+    'avg_tweets_per_week': '1W',
+    'avg_tweets_per_day': '1D',
+    'avg_tweets_per_hour': '1H',
+    'avg_tweets_per_min': '1min',
+}
+
+# Bin number of each int64 nanosecond timestamp for a window
+def window_bins(stamps, window):
+    if window in ('W', '1W'):
+        # 1970-01-01 was a Thursday, shifting by 3 days starts the weeks on Monday
+        return (stamps // DAY + 3) // 7
+    return stamps // pd.Timedelta(window).value
+
+# Averages from each user's first and last timestamp and number of counted tweets, users with no timestamp are NaN
+def span_rates(first, last, counted, windows=RATE_WINDOWS):
+    dated = first <= last
+    first = np.where(dated, first, 0)
+    last = np.where(dated, last, 0)
+    rates = {}
+    for column, window in windows.items():
+        span = window_bins(last, window) - window_bins(first, window) + 1
+        rates[column] = np.where(dated, counted / span, NaN)
+    return rates
+
+# Rates for n users from aligned arrays of user codes, int64 timestamps and whether each tweet is counted
+# (pd.Grouper's count() skips null tweetids). With occupancy, <column>_active is also returned: the average
+# number of tweets in the bins that have at least one tweet, found from one sort by user and time
+def segment_rate_statistics(codes, stamps, counted, n, windows=RATE_WINDOWS, occupancy=False):
+    codes = np.asarray(codes, dtype='int64')
+    stamps = np.asarray(stamps, dtype='int64')
+    counted_num = np.bincount(codes, weights=counted, minlength=n)
+    tweet_num = np.bincount(codes, minlength=n)
+    first = np.full(n, np.iinfo('int64').max)
+    last = np.full(n, np.iinfo('int64').min)
+
+    order = np.lexsort((stamps, codes))
+    codes = codes[order]
+    stamps = stamps[order]
+    present = tweet_num > 0
+    ends = np.cumsum(tweet_num)
+    first[present] = stamps[ends[present] - tweet_num[present]]
+    last[present] = stamps[ends[present] - 1]
+    rates = span_rates(first, last, counted_num, windows)
+
+    if occupancy:
+        counted = np.asarray(counted)[order]
+        new_user = np.ones(len(codes), dtype=bool)
+        new_user[1:] = codes[1:] != codes[:-1]
+        for column, window in windows.items():
+            # Bins only grow with time, so after the sort a new bin starts wherever the bin number changes
+            bins = window_bins(stamps, window)
+            new_bin = new_user.copy()
+            new_bin[1:] |= bins[1:] != bins[:-1]
+            # Bins holding only null tweetids would be counted as empty by count()
+            bin_ids = np.cumsum(new_bin) - 1
+            occupied_bins = np.bincount(bin_ids, weights=counted, minlength=bin_ids[-1] + 1 if len(bin_ids) else 0) > 0
+            bin_users = codes[new_bin]
+            active = np.bincount(bin_users[occupied_bins], minlength=n)
+            rates[column + '_active'] = np.divide(counted_num, active, out=np.full(n, NaN), where=active > 0)
+    return rates
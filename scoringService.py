@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import pickle
+import pandas as pd
+try:
+    from . import ensembleVoting, modelRegistry, textPreprocessing, tweetMiner, tweetProcessing, userFeatureState
+except ImportError:
+    import ensembleVoting, modelRegistry, textPreprocessing, tweetMiner, tweetProcessing, userFeatureState
+
+# Local scoring service for the Step4 ensemble. The vectorizers and models are loaded once, and every request is one
+# JSON line holding a user id and that user's raw tweets (status JSON payloads, as TweetMiner's raw data keeps them)
+# sent over a Unix socket or TCP. Requests that arrive together are scored as one micro-batch: the tweets of all
+# users go through process_tweets and a UserFeatureState together, each model predicts the whole batch at once and
+# the answers are voted on with ensembleVoting.majority_vote. Each reply is one JSON line in the order of the requests.
+
+# User columns the Random Forest and SVC models are trained on in Step4
+FEATURE_COLUMNS = ["user_reported_location", "user_profile_description", "follower_count", "following_count",
+                   "retweet_ratio", "english_tweet_proportion", "earliest_tweet_time", "latest_tweet_time",
+                   "average_tweet_time", "median_tweet_time", "tweet_count", "stddev_tweet_time"] + \
+                  ["mode_" + str(hour) for hour in range(24)] + \
+                  ["avg_tweets_per_week", "avg_tweets_per_day", "avg_tweets_per_hour", "avg_tweets_per_min",
+                   "avg_quote_count", "avg_like_count", "avg_retweet_count", "avg_hashtags", "avg_urls",
+                   "avg_user_mentions"]
+
+def load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+class EnsembleScorer(object):
+
+    # text_models is a list of (vectorizer, model) pairs scored on the user BoW, feature_models a list of models
+    # scored on FEATURE_COLUMNS, e.g. the GridSearchCV objects Step4 pickles. weights and tie are passed to
+    # ensembleVoting.majority_vote, text models first
+    def __init__(self, text_models=(), feature_models=(), cache=None, weights=None, tie='first'):
+        self.text_models = list(text_models)
+        self.feature_models = list(feature_models)
+        self.weights = weights
+        self.tie = tie
+        self.cache = cache if cache is not None else textPreprocessing.TextCache()
+
+    @classmethod
+    def from_files(cls, text_models=(), feature_models=()):
+        return cls([(load_pickle(vectorizer), load_pickle(model)) for vectorizer, model in text_models],
+                   [load_pickle(model) for model in feature_models])
+
+    # Load a model set saved with save_to_registry, the latest version by default
+    @classmethod
+    def from_registry(cls, root, name, version=None):
+        artifacts, manifest = modelRegistry.ModelRegistry(root).load(name, version)
+        metadata = manifest['metadata']
+        schema = manifest['feature_schema'] or []
+        if [column['name'] for column in schema] != FEATURE_COLUMNS:
+            print('scoringService_error: model set ' + name + ' was trained on different feature columns')
+        return cls([(artifacts[vectorizer], artifacts[model]) for vectorizer, model in metadata['text_models']],
+                   [artifacts[model] for model in metadata['feature_models']],
+                   weights=metadata.get('weights'), tie=metadata.get('tie', 'first'))
+
+    # Save the vectorizers and models as a new version of name in a ModelRegistry, with the feature schema
+    # taken from user_df, a user frame the feature models were trained on
+    def save_to_registry(self, root, name, user_df):
+        artifacts = {}
+        metadata = {'text_models': [], 'feature_models': [], 'weights': self.weights, 'tie': self.tie}
+        for i, (vectorizer, model) in enumerate(self.text_models):
+            artifacts['vectorizer_' + str(i)] = vectorizer
+            artifacts['text_model_' + str(i)] = model
+            metadata['text_models'].append(['vectorizer_' + str(i), 'text_model_' + str(i)])
+        for i, model in enumerate(self.feature_models):
+            artifacts['feature_model_' + str(i)] = model
+            metadata['feature_models'].append('feature_model_' + str(i))
+        schema = modelRegistry.frame_schema(user_df, FEATURE_COLUMNS)
+        return modelRegistry.ModelRegistry(root).save(name, artifacts, schema, metadata)
+
+    # User and tweet frames of a batch of requests, cleaned the way Step3 cleans the datasets
+    def frames(self, requests):
+        users = []
+        records = []
+        for request in requests:
+            tweets = request.get('tweets', [])
+            profile = request.get('user') or (tweets[0]['user'] if tweets else {})
+            users.append({
+                'userid':                   request['userid'],
+                'user_reported_location':   int(bool(profile.get('location'))),
+                'user_profile_description': int(bool(profile.get('description'))),
+                'follower_count':           profile.get('followers_count', 0),
+                'following_count':          profile.get('friends_count', 0),
+            })
+            for status in tweets:
+                record = tweetMiner.status_record(status, count_entities=True)
+                records.append(record._replace(userid=request['userid']))
+        user_df = pd.DataFrame(users, columns=['userid', 'user_reported_location', 'user_profile_description',
+                                               'follower_count', 'following_count'])
+        tweet_df = pd.DataFrame.from_records(records, columns=tweetMiner.TWEET_COLUMNS)
+        tweet_df.loc[:,'is_retweet'] = tweet_df.loc[:,'is_retweet'].astype('int')
+        tweet_df.loc[:,'tweet_time'] = pd.to_datetime(tweet_df.loc[:,'tweet_time'])
+        return user_df, tweet_df
+
+    # User features of a batch: BoW strings as the vectorizers take them and the pattern of life columns
+    def features(self, requests):
+        user_df, tweet_df = self.frames(requests)
+        tweetProcessing.process_tweets(tweet_df, cache=self.cache)
+        state = userFeatureState.UserFeatureState(user_df.loc[:,'userid'])
+        state.update(tweet_df)
+        state.apply(user_df, toList=False)
+        return user_df.fillna(0)
+
+    # Verdict and per model votes for every request of a batch
+    def score(self, requests):
+        user_df = self.features(requests)
+        votes = []
+        for vectorizer, model in self.text_models:
+            votes.append(model.predict(vectorizer.transform(user_df.loc[:,'BoW'])))
+        for model in self.feature_models:
+            votes.append(model.predict(user_df.loc[:,FEATURE_COLUMNS]))
+        verdict = ensembleVoting.majority_vote(votes, self.weights, self.tie)
+        return [{'userid': request['userid'], 'info_op': int(verdict[i]), 'votes': [int(vote[i]) for vote in votes]}
+                for i, request in enumerate(requests)]
+
+# Collects requests that arrive within max_delay seconds of each other, up to max_batch, and scores them together
+# on a worker thread so the event loop keeps accepting connections. Batches are scored one at a time on a single
+# dedicated thread, the scorer's text cache and models are not meant to be used by several threads at once
+class MicroBatcher(object):
+
+    def __init__(self, score, max_batch=512, max_delay=0.005):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='scoring')
+
+    async def submit(self, request):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            asyncio.get_running_loop().create_task(self.run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((request, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            requests = [request for request, future in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.score, requests)
+            except Exception as e:
+                results = [{'userid': request.get('userid'), 'error': str(e)} for request in requests]
+            for (request, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+class ScoringServer(object):
+
+    def __init__(self, scorer, max_batch=512, max_delay=0.005):
+        self.batcher = MicroBatcher(scorer.score, max_batch, max_delay)
+
+    async def reply(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {'error': str(e)}
+        if not isinstance(request, dict) or 'userid' not in request:
+            return {'error': 'request must be a JSON object with a userid'}
+        return await self.batcher.submit(request)
+
+    # One JSON request per line, replies are written in request order. Requests on one connection are scored
+    # concurrently, so a client can pipeline many of them
+    async def handle(self, reader, writer):
+        replies = asyncio.Queue()
+
+        async def write_replies():
+            while True:
+                reply = await replies.get()
+                if reply is None:
+                    break
+                writer.write((json.dumps(await reply) + '\n').encode())
+                await writer.drain()
+
+        writing = asyncio.ensure_future(write_replies())
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                await replies.put(asyncio.ensure_future(self.reply(line)))
+        await replies.put(None)
+        await writing
+        writer.close()
+
+    async def serve(self, path=None, host='127.0.0.1', port=8765):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Score Twitter users with the Step4 ensemble')
+    parser.add_argument('--socket', help='Unix socket path, TCP is used if not given')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--text-model', nargs=2, action='append', default=[], metavar=('VECTORIZER', 'MODEL'))
+    parser.add_argument('--feature-model', action='append', default=[], metavar='MODEL')
+    parser.add_argument('--registry', help='ModelRegistry directory to load the models from instead of pickles')
+    parser.add_argument('--name', help='model set name in the registry')
+    parser.add_argument('--version', type=int, help='model set version, the latest if not given')
+    parser.add_argument('--max-batch', type=int, default=512)
+    parser.add_argument('--max-delay', type=float, default=0.005)
+    args = parser.parse_args()
+    if args.registry is not None:
+        scorer = EnsembleScorer.from_registry(args.registry, args.name, args.version)
+    else:
+        scorer = EnsembleScorer.from_files(args.text_model, args.feature_model)
+    server = ScoringServer(scorer, args.max_batch, args.max_delay)
+    asyncio.run(server.serve(args.socket, args.host, args.port))
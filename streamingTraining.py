@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.preprocessing import normalize
+
+# Out-of-core training of the Bag of Words classifiers. User BoW is read from the saved user frame a chunk at a
+# time, hashed into a fixed number of features (no vocabulary has to be held, and the features match
+# tokenStore.HashedVocabulary) and fed to SGDClassifier/MultinomialNB through partial_fit. With tfidf, a first pass
+# over the chunks counts document frequencies so the counts can be weighted the way TfidfVectorizer does. Memory
+# depends on n_features and chunksize, not on the number of users.
+
+# BoW of a user frame chunk as the space separated strings the vectorizers take. Lists are joined, and the
+# "['a', 'b']" strings of a user frame saved to CSV are cleaned the way Step4 cleans them
+def bow_strings(bows):
+    if len(bows) and isinstance(bows.iloc[0], (list, np.ndarray)):
+        return bows.map(lambda bow: ' '.join(bow) if bow is not None else '')
+    return bows.fillna('').astype(str).str.replace("'", '').str.replace(",", '').str.strip('][')
+
+# Chunks of (BoW strings, labels) from a user frame saved as CSV or Parquet (frameStorage), or from a list of frames
+def bow_chunks(source, chunksize=10000, label='info_op'):
+    if not isinstance(source, str):
+        frames = source
+    elif source.endswith('.parquet'):
+        frames = (batch.to_pandas() for batch in pq.ParquetFile(source).iter_batches(chunksize, columns=['BoW', label]))
+    else:
+        frames = pd.read_csv(source, usecols=['BoW', label], chunksize=chunksize)
+    for frame in frames:
+        yield bow_strings(frame.loc[:,'BoW']), frame.loc[:,label].to_numpy()
+
+def hashing_vectorizer(n_features=2**20):
+    return HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+
+# Inverse document frequencies accumulated chunk by chunk, with TfidfVectorizer's defaults (smooth idf, l2 norm)
+class StreamingIDF(object):
+
+    def __init__(self, n_features=2**20, norm='l2'):
+        self.document_frequency = np.zeros(n_features, dtype='int64')
+        self.n_documents = 0
+        self.norm = norm
+
+    def partial_fit(self, counts):
+        self.document_frequency += np.bincount(counts.indices, minlength=len(self.document_frequency))
+        self.n_documents += counts.shape[0]
+        return self
+
+    @property
+    def idf_(self):
+        return np.log((1 + self.n_documents) / (1 + self.document_frequency)) + 1
+
+    def transform(self, counts):
+        weighted = counts.multiply(self.idf_).tocsr()
+        return normalize(weighted, norm=self.norm) if self.norm else weighted
+
+class StreamingClassifier(object):
+
+    # models is a dict of name -> estimator with partial_fit, by default Step4's SGD and Multinomial Naive Bayes
+    def __init__(self, models=None, n_features=2**20, tfidf=False, classes=(0, 1)):
+        if models is None:
+            models = {'sgd': SGDClassifier(random_state=42), 'mnb': MultinomialNB()}
+        self.models = models
+        self.vectorizer = hashing_vectorizer(n_features)
+        self.idf = StreamingIDF(n_features) if tfidf else None
+        self.classes = np.asarray(classes)
+
+    def features(self, texts):
+        counts = self.vectorizer.transform(texts)
+        return self.idf.transform(counts) if self.idf is not None else counts
+
+    # chunks is a function returning a new iterator of (BoW strings, labels) chunks, e.g.
+    # lambda: bow_chunks('all_users_processed.csv'), since the IDF pass and every epoch read the chunks again
+    def fit(self, chunks, epochs=1, verbose=True):
+        if self.idf is not None:
+            for texts, labels in chunks():
+                self.idf.partial_fit(self.vectorizer.transform(texts))
+        for epoch in range(epochs):
+            users = 0
+            for texts, labels in chunks():
+                X = self.features(texts)
+                for model in self.models.values():
+                    model.partial_fit(X, labels, classes=self.classes)
+                users += len(labels)
+            if verbose:
+                print('Epoch ' + str(epoch + 1) + ' of ' + str(epochs) + ': trained on ' + str(users) + ' users')
+        return self
+
+    def predict(self, texts):
+        X = self.features(texts)
+        return {name: model.predict(X) for name, model in self.models.items()}
@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+import requests
+import asyncTweetMiner
+
+
+def user(i, screen_name):
+    return {'id': i, 'id_str': str(i), 'name': screen_name, 'screen_name': screen_name, 'location': '',
+            'description': '', 'url': None, 'followers_count': 1, 'friends_count': 2,
+            'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'lang': None}
+
+
+def status(i):
+    return {'id': i, 'id_str': str(i), 'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'full_text': 'tweet',
+            'lang': 'en', 'source': '<a href="x">Web</a>', 'retweet_count': 0, 'favorite_count': 0,
+            'is_quote_status': False, 'in_reply_to_status_id': None, 'in_reply_to_user_id': None,
+            'coordinates': None, 'place': None, 'user': user(1, 'a'),
+            'entities': {'hashtags': [], 'urls': [], 'user_mentions': []}}
+
+
+# Fake clock the miner's sleeps advance, so rate limit waits take no time
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def miner(transport, clock, credentials=1):
+    return asyncTweetMiner.AsyncTweetMiner([{}] * credentials, transport=transport, clock=clock, sleep=clock.sleep)
+
+
+def test_429_is_retried_after_the_window_resets():
+    clock = Clock()
+    calls = []
+
+    async def transport(credential, endpoint, params):
+        calls.append(clock.now)
+        if len(calls) == 1:
+            return 429, {'x-rate-limit-limit': '900', 'x-rate-limit-remaining': '0', 'x-rate-limit-reset': '100'}, \
+                {'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}
+        return 200, {}, user(7, 'seven')
+
+    data, raw_data, usersnotfound = asyncio.run(miner(transport, clock).mine_user_info(user_ids=[7]))
+    assert [row['user_screen_name'] for row in data] == ['seven']
+    assert calls == [0., 101.]
+    assert clock.slept == [101.]
+
+
+def test_rate_limit_windows_are_shared_across_credentials():
+    clock = Clock()
+    used = []
+
+    async def transport(credential, endpoint, params):
+        used.append(credential)
+        remaining = 2 - used.count(credential) if clock.now < 1000 else 1
+        return 200, {'x-rate-limit-limit': '2', 'x-rate-limit-remaining': str(remaining),
+                     'x-rate-limit-reset': '1000' if clock.now < 1000 else '1900'}, user(1, 'a')
+
+    async def lookups(m):
+        for _ in range(5):
+            await m.request('users/show', {'user_id': 1})
+
+    m = miner(transport, clock, credentials=2)
+    asyncio.run(lookups(m))
+    assert used == [0, 1, 0, 1, 0]
+    assert clock.slept == [1001.]
+
+
+def test_missing_user_does_not_abort_the_others():
+    clock = Clock()
+    sent = []
+
+    async def transport(credential, endpoint, params):
+        sent.append(params)
+        if params.get('screen_name') == 'deleted':
+            return 404, {}, {'errors': [{'code': 50, 'message': 'User not found.'}]}
+        if 'user_id' in params:
+            return 200, {}, user(params['user_id'], 'u' + str(params['user_id']))
+        return 200, {}, user(99, params['screen_name'])
+
+    m = miner(transport, clock)
+    data, raw_data, usersnotfound = asyncio.run(m.mine_user_info(user_ids=[1, 2], screen_names=['deleted', '12345']))
+    assert [row['user_screen_name'] for row in data] == ['u1', 'u2', '12345']
+    assert usersnotfound == 1
+    assert {'screen_name': '12345'} in sent
+    assert asyncio.run(m.user_info('screen_name', 'deleted')) is None
+
+
+def test_error_code_comes_from_the_payload():
+    async def transport(credential, endpoint, params):
+        return 404, {}, {'errors': [{'code': 34, 'message': 'Sorry, that page does not exist.'}]}
+
+    with pytest.raises(asyncTweetMiner.TweepError) as error:
+        asyncio.run(miner(transport, Clock()).request('users/show', {'screen_name': 'x'}))
+    assert error.value.api_code == 34
+    assert error.value.response.status_code == 404
+
+
+def test_transport_errors_end_only_their_query():
+    clock = Clock()
+    failures = {'down': 10, 'flaky': 1}
+
+    async def transport(credential, endpoint, params):
+        if failures.get(params['q'], 0) > 0:
+            failures[params['q']] -= 1
+            raise requests.ConnectionError('connection reset')
+        if 'max_id' in params:
+            return 200, {}, {'statuses': []}
+        return 200, {}, {'statuses': [status(100)]}
+
+    data, raw_data = asyncio.run(miner(transport, clock).mine_topics(['up', 'down', 'flaky']))
+    assert len(raw_data) == 2
+    assert sorted(clock.slept) == [1., 1., 2., 4.]
@@ -0,0 +1,12 @@
+import numpy as np
+import pytest
+import ensembleVoting
+
+
+def test_weight_count_must_match_models():
+    predictions = [np.array([0, 1, 1]), np.array([1, 1, 0]), np.array([0, 0, 1])]
+    with pytest.raises(ValueError, match='2 weights for 3 models'):
+        ensembleVoting.majority_vote(predictions, weights=[1., 2.])
+    with pytest.raises(ValueError, match='4 weights for 3 models'):
+        ensembleVoting.soft_vote([np.full((3, 2), 0.5)] * 3, weights=[1., 1., 1., 1.])
+    assert list(ensembleVoting.majority_vote(predictions, weights=[1., 2., 1.])) == [0, 1, 1]
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+import tweetProcessing
+
+
+def test_io_dataset_plain_lists():
+    # Step3 counts the IO datasets' entity columns by splitting on ', '
+    entities = pd.Series(['[foo, bar]', '[foo]', '[]', "['foo', 'bar', 'baz']"])
+    np.testing.assert_array_equal(tweetProcessing.entityCount(entities, 'text'), [2, 1, 0, 3])
+
+
+def test_quoted_lists():
+    # Step3 counts the legitimate tweets by swapping quotes and parsing as JSON
+    entities = pd.Series(["['foo', 'bar']", "['https://t.co/a']", '["a", "b", "c"]'])
+    np.testing.assert_array_equal(tweetProcessing.entityCount(entities, 'url'), [2, 1, 3])
+
+
+def test_entity_dicts():
+    hashtag = "{'text': 'tag%d', 'indices': [0, 4]}"
+    entities = pd.Series(['[' + hashtag % 1 + ', ' + hashtag % 2 + ']', '[' + hashtag % 1 + ']',
+                          '[' + hashtag % 1 + ', {\'text\': \'cut', None, 3, ['a', 'b']])
+    np.testing.assert_array_equal(tweetProcessing.entityCount(entities, 'text'), [2, 1, 2, 0, 3, 2])
@@ -0,0 +1,116 @@
+import pytest
+import tweepy
+import miningJobs
+import tweetMiner
+
+
+class Status(object):
+
+    def __init__(self, i):
+        self._json = {'id': i, 'id_str': str(i), 'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+                      'full_text': 'tweet ' + str(i), 'lang': 'en', 'source': '<a href="x">Web</a>',
+                      'retweet_count': 0, 'favorite_count': 0, 'is_quote_status': False,
+                      'in_reply_to_status_id': None, 'in_reply_to_user_id': None, 'coordinates': None,
+                      'place': None, 'entities': {'hashtags': [], 'urls': [], 'user_mentions': []},
+                      'user': {'id': 1, 'id_str': '1', 'screen_name': 'a', 'name': 'a', 'location': '',
+                               'description': '', 'url': None, 'followers_count': 1, 'friends_count': 1,
+                               'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'lang': None}}
+
+
+class Response(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def server_error():
+    return tweepy.error.TweepError('Internal error', Response(503))
+
+
+# Search and user timeline API with 2 statuses per page from id 100 down to 91, failing on the calls listed in
+# failures. The timeline of protected is not authorized
+class API(object):
+
+    def __init__(self, failures=()):
+        self.calls = 0
+        self.failures = set(failures)
+
+    def search(self, q, count, max_id=None, **params):
+        self.calls += 1
+        if self.calls in self.failures:
+            raise server_error()
+        top = max_id or 100
+        return [Status(i) for i in range(top, max(top - count, 90), -1)]
+
+    def user_timeline(self, screen_name, count, max_id=None, **params):
+        if screen_name == 'protected':
+            self.calls += 1
+            raise tweepy.error.TweepError('Not authorized.', Response(401))
+        return self.search(screen_name, count, max_id)
+
+
+class Miner(object):
+
+    call = tweetMiner.TweetMiner.call
+
+    def __init__(self, api):
+        self.api = api
+        self.result_limit = 2
+        self.count_entities = False
+        self.waits = []
+
+    def rate_limit_wait(self, endpoint, seconds=60*16):
+        self.waits.append(endpoint)
+
+
+def tweet_ids(job):
+    data, raw_data = job.results(miningJobs.TOPIC, ['a'])
+    return [status['id'] for status in raw_data]
+
+
+def test_failed_request_is_retried_and_not_checkpointed(tmp_path):
+    path = str(tmp_path / 'job.jsonl')
+    job = miningJobs.MiningJob(Miner(API(failures=[2, 3])), path, max_pages=3, backoff=0)
+    job.mine_topics(['a'])
+    assert tweet_ids(job) == [100, 99, 98, 97, 96, 95]
+    assert [record['page'] for record in job.records()] == [1, 2, 3]
+
+
+def test_persistent_failure_raises_without_checkpoint(tmp_path):
+    path = str(tmp_path / 'job.jsonl')
+    job = miningJobs.MiningJob(Miner(API(failures=[2, 3, 4])), path, max_pages=3, retries=2, backoff=0)
+    with pytest.raises(tweepy.error.TweepError):
+        job.mine_topics(['a'])
+    assert [record['page'] for record in job.records()] == [1]
+
+    resumed = miningJobs.MiningJob(Miner(API()), path, max_pages=3)
+    resumed.mine_topics(['a'])
+    assert tweet_ids(resumed) == [100, 99, 98, 97, 96, 95]
+
+
+def test_page_cap_is_not_exhaustion(tmp_path):
+    path = str(tmp_path / 'job.jsonl')
+    miningJobs.MiningJob(Miner(API()), path, max_pages=2).mine_topics(['a'])
+    api = API()
+    job = miningJobs.MiningJob(Miner(api), path, max_pages=10)
+    job.mine_topics(['a'])
+    assert tweet_ids(job) == list(range(100, 90, -1))
+    assert job.cursors[(miningJobs.TOPIC, 'a')]['exhausted']
+
+    api.calls = 0
+    job.mine_topics(['a'])
+    assert api.calls == 0
+
+
+def test_permanent_failure_ends_only_that_query(tmp_path):
+    path = str(tmp_path / 'job.jsonl')
+    api = API()
+    job = miningJobs.MiningJob(Miner(api), path, max_pages=2, backoff=0)
+    data, raw_data = job.mine_users_tweets(['a', 'protected', 'b'])
+    assert [status['id'] for status in raw_data] == [100, 99, 98, 97] * 2
+    assert api.calls == 5
+    assert [record['error'] for record in job.records() if record['query'] == 'protected'] == ['Not authorized.']
+
+    api.calls = 0
+    miningJobs.MiningJob(Miner(api), path, max_pages=2, backoff=0).mine_users_tweets(['a', 'protected', 'b'])
+    assert api.calls == 0
@@ -0,0 +1,39 @@
+import numpy as np
+from sklearn.model_selection import GridSearchCV
+from sklearn.linear_model import SGDClassifier
+import modelSearch
+
+
+def test_final_rung_matches_grid_search():
+    # 103 samples do not split evenly into 5 folds, so the folds differ in size
+    rng = np.random.RandomState(0)
+    X = rng.poisson(1., (103, 30))
+    y = (X[:, :5].sum(axis=1) + rng.randint(0, 4, 103) > 6).astype(int)
+    grid = {'alpha': [0.0001, 0.01, 1.], 'penalty': ['l1', 'l2'], 'max_iter': [20]}
+
+    search = modelSearch.HalvingSearch(SGDClassifier(random_state=0), grid, factor=3, min_resources=20, n_jobs=1,
+                                       verbose=False).fit(X, y)
+    reference = GridSearchCV(SGDClassifier(random_state=0), grid, cv=5).fit(X, y)
+
+    final = search.cv_results_[search.cv_results_['rung'] == search.cv_results_['rung'].max()]
+    assert len(final) < 6
+    expected = {repr(sorted(params.items())): score for params, score in
+                zip(reference.cv_results_['params'], reference.cv_results_['mean_test_score'])}
+    for params, score in zip(final['params'], final['mean_test_score']):
+        assert score == expected[repr(sorted(params.items()))]
+
+
+def test_failing_config_scores_error_score():
+    rng = np.random.RandomState(0)
+    X = rng.poisson(1., (120, 30))
+    y = (X[:, :5].sum(axis=1) > 5).astype(int)
+    # SGDClassifier rejects the unknown loss when fitting, so every fold of that config fails
+    grid = {'loss': ['hinge', 'bogus', 'log_loss'], 'max_iter': [20]}
+
+    search = modelSearch.HalvingSearch(SGDClassifier(random_state=0), grid, factor=3, min_resources=20, n_jobs=1,
+                                       verbose=False).fit(X, y)
+    first = search.cv_results_[search.cv_results_['rung'] == 0]
+    failed = first[[params['loss'] == 'bogus' for params in first['params']]]
+    assert failed['mean_test_score'].tolist() == [-np.inf]
+    assert search.best_params_['loss'] != 'bogus'
+    assert np.isfinite(search.best_score_)
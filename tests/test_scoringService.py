@@ -0,0 +1,83 @@
+import asyncio
+import json
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.linear_model import SGDClassifier
+import scoringService
+import textPreprocessing
+
+
+# Offline stand-ins for the NLTK tagger and lemmatizer and gensim's tokenizer
+class Tagger(object):
+
+    def tag_sents(self, sentences):
+        return [[(word, 'NN') for word in sentence] for sentence in sentences]
+
+
+class Lemmatizer(object):
+
+    def lemmatize(self, word, pos='n'):
+        return word.rstrip('s')
+
+
+def status(i, userid, text):
+    return {'id': i, 'id_str': str(i), 'created_at': 'Wed Oct 1%d 2%d:19:24 +0000 2018' % (i % 10, i % 4),
+            'full_text': text, 'lang': 'en', 'source': '<a href="x">Web</a>', 'retweet_count': 0,
+            'favorite_count': 0, 'is_quote_status': False, 'in_reply_to_status_id': None,
+            'in_reply_to_user_id': None, 'coordinates': None, 'place': None,
+            'entities': {'hashtags': [], 'urls': [], 'user_mentions': []},
+            'user': {'id': userid, 'id_str': str(userid), 'screen_name': 'u' + str(userid), 'name': 'u',
+                     'location': 'here' if userid % 3 else '', 'description': '', 'url': None,
+                     'followers_count': userid, 'friends_count': 2 * userid,
+                     'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'lang': None}}
+
+
+def scorer(cache):
+    docs = ['dog run fast', 'cat sleep', 'dog bark loud', 'cat eat fish'] * 10
+    labels = [0, 1, 0, 1] * 10
+    vectorizer = CountVectorizer().fit(docs)
+    text_model = SGDClassifier(random_state=0).fit(vectorizer.transform(docs), labels)
+    X = pd.DataFrame(np.random.default_rng(0).random((40, len(scoringService.FEATURE_COLUMNS))),
+                     columns=scoringService.FEATURE_COLUMNS)
+    feature_model = RandomForestClassifier(5, random_state=0).fit(X, labels)
+    return scoringService.EnsembleScorer([(vectorizer, text_model)], [feature_model], cache=cache)
+
+
+def test_serve_with_disk_backed_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(textPreprocessing, 'tagger', Tagger())
+    monkeypatch.setattr(textPreprocessing, 'lemmatizer', Lemmatizer())
+    monkeypatch.setattr(textPreprocessing, 'simple_preprocess', lambda text: text.lower().split())
+    monkeypatch.setattr(textPreprocessing, 'stopwords', frozenset(['the', 'are']))
+    textPreprocessing.lemmatize_word.cache_clear()
+
+    texts = ['the dogs are running fast', 'cats sleeping all day']
+    requests = [{'userid': u, 'tweets': [status(1000 * u + i, u, texts[u % 2]) for i in range(4)]}
+                for u in range(1, 21)]
+    expected = scorer(textPreprocessing.TextCache()).score(requests)
+
+    # The cache is created on this thread and used on the server's scoring thread
+    cache = textPreprocessing.TextCache(path=str(tmp_path / 'bows.sqlite'))
+    server = scoringService.ScoringServer(scorer(cache), max_batch=8)
+
+    async def serve():
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        reader, writer = await asyncio.open_connection('127.0.0.1', listener.sockets[0].getsockname()[1])
+        for request in requests:
+            writer.write((json.dumps(request) + '\n').encode())
+        await writer.drain()
+        replies = [json.loads(await reader.readline()) for _ in requests]
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return replies
+
+    assert asyncio.run(serve()) == expected
+    assert cache.misses == len(texts)
+    cache.close()
+
+    reopened = textPreprocessing.TextCache(path=str(tmp_path / 'bows.sqlite'))
+    assert reopened.get(textPreprocessing.TextCache.key(textPreprocessing.clean_text(texts[0]))) == \
+        ['dog', 'running', 'fast']
+    reopened.close()
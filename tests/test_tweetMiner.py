@@ -0,0 +1,76 @@
+import tweepy
+import tweetMiner
+
+
+class User(object):
+
+    def __init__(self, i, screen_name):
+        self.id = i
+        self.id_str = str(i)
+        self.screen_name = screen_name
+        self._json = {'id': i, 'name': screen_name, 'screen_name': screen_name, 'location': '', 'description': '',
+                      'url': None, 'followers_count': 1, 'friends_count': 2,
+                      'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'lang': None}
+
+
+# users/lookup over a fixed set of accounts. fail_once lists users whose first lookup fails, and flaky users are
+# left out of the first response that should include them
+class API(object):
+
+    def __init__(self, users, fail_once=(), flaky=()):
+        self.users = users
+        self.fail_once = set(fail_once)
+        self.flaky = set(flaky)
+        self.calls = []
+
+    def lookup_users(self, user_ids=None, screen_names=None):
+        self.calls.append(list(user_ids or screen_names))
+        failing = self.fail_once.intersection(user_ids or screen_names)
+        if failing:
+            self.fail_once -= failing
+            raise tweepy.error.TweepError('Internal error')
+        found = []
+        for user in self.users:
+            if (user_ids and user.id_str in user_ids) or (screen_names and user.screen_name.lower() in screen_names):
+                if user.screen_name in self.flaky:
+                    self.flaky.discard(user.screen_name)
+                else:
+                    found.append(user)
+        return found
+
+    def get_user(self, id):
+        for user in self.users:
+            if str(id) in (user.id_str, user.screen_name):
+                return user
+        raise tweepy.error.TweepError('User not found.')
+
+
+def miner(api):
+    m = tweetMiner.TweetMiner.__new__(tweetMiner.TweetMiner)
+    m.api = api
+    return m
+
+
+def test_all_digit_screen_names_are_looked_up_as_names():
+    api = API([User(1, 'first'), User(2, '12345'), User(3, 'third')])
+    data, raw_data, usersnotfound = miner(api).mine_user_info_batched(user_ids=[3, '1', 9], screen_names=['12345'])
+    assert [user['user_screen_name'] for user in data] == ['third', 'first', '12345']
+    assert usersnotfound == [9]
+
+
+def test_only_failed_and_missing_users_are_retried():
+    users = [User(i, 'user' + str(i)) for i in range(1, 8)]
+    api = API(users, fail_once=['user7'], flaky=['user2'])
+    names = ['User' + str(i) for i in range(1, 8)] + ['ghost']
+    data, raw_data, usersnotfound = miner(api).mine_user_info_batched(screen_names=names, batch_size=3, retries=2)
+    assert [user['userid'] for user in data] == list(range(1, 8))
+    assert usersnotfound == ['ghost']
+    assert api.calls == [['user1', 'user2', 'user3'], ['user4', 'user5', 'user6'], ['user7', 'ghost', 'user2'],
+                         ['user7', 'ghost', 'user2'], ['ghost']]
+
+
+def test_mine_user_info_rows_match_format_user():
+    users = [User(1, 'first'), User(2, 'second')]
+    data, raw_data, usersnotfound = miner(API(users)).mine_user_info(['second', 'missing', '1'])
+    assert data == [tweetMiner.format_user(users[1]._json), tweetMiner.format_user(users[0]._json)]
+    assert usersnotfound == 1
@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pandas as pd
+import benchmarkPipeline
+import tweetProcessing
+import userFeatureState
+
+
+def frames():
+    user_df, tweet_df = benchmarkPipeline.synthetic_frames(40, 10, vocabulary_size=200, seed=1)
+    return user_df, benchmarkPipeline.with_bow(tweet_df)
+
+
+def test_update_user_features_path_without_suffix(tmp_path):
+    user_df, tweet_df = frames()
+    path = str(tmp_path / 'state')
+    for part in np.array_split(np.arange(len(tweet_df)), 3):
+        incremental = user_df.copy()
+        tweetProcessing.update_user_features(path, incremental, tweet_df.iloc[part], toList=False)
+    assert os.listdir(str(tmp_path)) == ['state']
+
+    full = user_df.copy()
+    state = userFeatureState.UserFeatureState(user_df['userid'])
+    state.update(tweet_df)
+    state.apply(full, toList=False)
+    pd.testing.assert_frame_equal(incremental, full)
+
+
+def test_merge_matches_single_pass():
+    user_df, tweet_df = frames()
+    first, second = np.array_split(np.arange(len(tweet_df)), 2)
+    merged = userFeatureState.UserFeatureState(user_df['userid'][::-1])
+    merged.update(tweet_df.iloc[first])
+    other = userFeatureState.UserFeatureState(user_df['userid'])
+    other.update(tweet_df.iloc[second])
+    merged.merge(other)
+
+    single = userFeatureState.UserFeatureState(user_df['userid'])
+    single.update(tweet_df)
+    a, b = user_df.copy(), user_df.copy()
+    merged.apply(a, toList=False)
+    single.apply(b, toList=False)
+    pd.testing.assert_frame_equal(a, b)
@@ -0,0 +1,261 @@
+import re
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from multiprocessing import Pool
+try:
+    from . import pipelineMetrics
+except ImportError:
+    import pipelineMetrics
+
+# Parallel version of tweetProcessing.preprocess_gensim. Texts are split into chunks that run on a process pool,
+# every worker loads one tagger and one lemmatizer, tags a whole chunk at once and memoizes lemmas so repeated
+# words are only looked up in WordNet once. Tokens are identical to preprocess_gensim. A TextCache in front of
+# the pool makes retweets and copy-pasted texts cost a dictionary lookup. NLTK and gensim are only imported when
+# the first text is preprocessed, so importing this module (and tweetProcessing) stays fast.
+
+URL_PATTERN = re.compile(r'https?://[^\s]+')
+RETWEET_PATTERN = re.compile(r'RT @[^\s]+')
+MENTION_PATTERN = re.compile(r'@[^\s]+')
+NON_ALPHANUMERIC_PATTERN = re.compile(r'[^a-zA-Z0-9]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# preprocess_gensim passes re.IGNORECASE as the positional count argument of re.sub, so only the first two
+# matches of each pattern are removed. Kept as is so the tokens the models were trained on do not change
+PATTERN_COUNT = int(re.IGNORECASE)
+
+LEMMA_CACHE_SIZE = 2**20
+CHUNK_SIZE = 1000
+
+# NLTK data is looked up in NLTK's usual places and then in NLTK_DATA_CACHE, where missing resources are
+# downloaded once. Set INFO_OPS_NLTK_DATA to use another directory, e.g. one copied to a machine without network
+NLTK_DATA_CACHE = os.environ.get('INFO_OPS_NLTK_DATA',
+                                 os.path.join(os.path.expanduser('~'), '.cache', 'info_ops', 'nltk_data'))
+
+tagger = None
+lemmatizer = None
+simple_preprocess = None
+stopwords = None
+
+# Name and path of the NLTK resources the tagger and lemmatizer need. NLTK 3.8.2 moved the tagger to a JSON model
+# under a new name
+def nltk_resources():
+    from nltk.tag.perceptron import PerceptronTagger
+    tagger_name = 'averaged_perceptron_tagger_eng' if hasattr(PerceptronTagger, 'load_from_json') else \
+        'averaged_perceptron_tagger'
+    return {'wordnet': 'corpora/wordnet', tagger_name: 'taggers/' + tagger_name + '/'}
+
+# Make the NLTK resources available, downloading the ones not found into NLTK_DATA_CACHE when download is True.
+# Returns the names of the resources that are still missing
+def find_nltk_resources(download=True):
+    import nltk
+    if NLTK_DATA_CACHE not in nltk.data.path:
+        nltk.data.path.append(NLTK_DATA_CACHE)
+    missing = []
+    for name, path in nltk_resources().items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(name)
+    if missing and download:
+        os.makedirs(NLTK_DATA_CACHE, exist_ok=True)
+        for name in missing:
+            nltk.download(name, download_dir=NLTK_DATA_CACHE, quiet=True)
+        return find_nltk_resources(download=False)
+    return missing
+
+# Load the tagger, lemmatizer and gensim's tokenizer once per process, used as the pool initializer
+def load_models():
+    global tagger, lemmatizer, simple_preprocess, stopwords
+    if tagger is None:
+        find_nltk_resources()
+        from nltk.stem import WordNetLemmatizer
+        from nltk.tag.perceptron import PerceptronTagger
+        tagger = PerceptronTagger()
+        lemmatizer = WordNetLemmatizer()
+    if simple_preprocess is None:
+        from gensim.parsing.preprocessing import STOPWORDS
+        from gensim.utils import simple_preprocess as gensim_simple_preprocess
+        stopwords = STOPWORDS
+        simple_preprocess = gensim_simple_preprocess
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize_word(word, pos):
+    return lemmatizer.lemmatize(word, pos=pos)
+
+# Same tag to WordNet part of speech mapping as tweetProcessing.lemmatize_all
+def lemmatize_tagged(tagged):
+    for word, tag in tagged:
+        if tag.startswith("NN"):
+            yield lemmatize_word(word, 'n')
+        elif tag.startswith('VB'):
+            yield lemmatize_word(word, 'v')
+        elif tag.startswith('JJ'):
+            yield lemmatize_word(word, 'a')
+        else:
+            yield word
+
+# Remove URLs, retweet annotation, usernames and non-alphanumeric characters, then split on whitespace
+def clean_text(text):
+    text = URL_PATTERN.sub('', text, PATTERN_COUNT)
+    text = RETWEET_PATTERN.sub('', text, PATTERN_COUNT)
+    text = MENTION_PATTERN.sub('', text, PATTERN_COUNT)
+    text = NON_ALPHANUMERIC_PATTERN.sub(' ', text)
+    text = WHITESPACE_PATTERN.sub(' ', text)
+    return text.split()
+
+# Tag and lemmatize a list of cleaned sentences in the current process, all sentences are tagged in one call
+def bow_chunk(sentences):
+    load_models()
+    bows = []
+    for tagged in tagger.tag_sents(sentences):
+        text = ' '.join(lemmatize_tagged(tagged))
+        bows.append([token for token in simple_preprocess(text) if token not in stopwords])
+    return bows
+
+def preprocess_chunk(texts):
+    return bow_chunk([clean_text(text) for text in texts])
+
+def chunks(items, chunk_size):
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+# Run worker over the items in chunks, on a pool unless one process is asked for or there is only one chunk
+def map_chunks(worker, items, processes, chunk_size):
+    if processes is None:
+        processes = os.cpu_count() or 1
+    results = []
+    if processes == 1 or len(items) <= chunk_size:
+        for chunk in chunks(items, chunk_size):
+            results.extend(worker(chunk))
+        return results
+
+    with Pool(processes, initializer=load_models) as pool:
+        for chunk_results in pool.imap(worker, chunks(items, chunk_size)):
+            results.extend(chunk_results)
+    return results
+
+# Bag of words cache keyed by a hash of the cleaned text. The most recently used max_size entries are kept in
+# memory, if path is given every entry is also written to a SQLite file so later runs start warm
+class TextCache(object):
+
+    def __init__(self, max_size=2**18, path=None):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db = None
+        self.pending = []
+        self.lock = threading.Lock()
+        if path is not None:
+            # The connection is used from whichever thread scores a batch, e.g. the scoring service's executor, so
+            # it is not tied to this thread and every use of it holds the lock
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS bows (key BLOB PRIMARY KEY, bow TEXT)')
+
+    @staticmethod
+    def key(sentence):
+        return hashlib.blake2b(' '.join(sentence).encode('utf-8'), digest_size=16).digest()
+
+    def remember(self, key, bow):
+        self.entries[key] = bow
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    # Returns the cached tokens or None, counting the lookup as a hit or a miss
+    def get(self, key):
+        with self.lock:
+            return self.lookup(key)
+
+    def lookup(self, key):
+        bow = self.entries.get(key)
+        if bow is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return bow
+        if self.db is not None:
+            row = self.db.execute('SELECT bow FROM bows WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                bow = row[0].split()
+                self.remember(key, bow)
+                self.disk_hits += 1
+                return bow
+        self.misses += 1
+        return None
+
+    def put(self, key, bow):
+        with self.lock:
+            self.remember(key, bow)
+            if self.db is not None:
+                self.pending.append((key, ' '.join(bow)))
+
+    # Write pending entries to the SQLite file
+    def flush(self):
+        with self.lock:
+            if self.db is not None and self.pending:
+                self.db.executemany('INSERT OR REPLACE INTO bows VALUES (?, ?)', self.pending)
+                self.db.commit()
+                self.pending = []
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.disk_hits) / lookups if lookups else 0.,
+            'size': len(self.entries),
+        }
+
+# Preprocess every text, returns a list of token lists in the same order. processes=None uses all cores and
+# processes=1 runs in the current process without a pool. With a cache, texts are cleaned here and only the
+# distinct cleaned texts that are not cached yet are sent to the workers
+@pipelineMetrics.timed(rows='texts')
+def preprocess_texts(texts, processes=None, chunk_size=CHUNK_SIZE, cache=None):
+    texts = list(texts)
+    if cache is None:
+        return map_chunks(preprocess_chunk, texts, processes, chunk_size)
+
+    hits, disk_hits, misses = cache.hits, cache.disk_hits, cache.misses
+
+    # Bags of words found for this call are kept here as well, so a small cache cannot evict them before use
+    keys = []
+    found = {}
+    missing = {}
+    for text in texts:
+        sentence = clean_text(text)
+        key = TextCache.key(sentence)
+        keys.append(key)
+        if key in found or key in missing:
+            cache.hits += 1
+            continue
+        bow = cache.get(key)
+        if bow is None:
+            missing[key] = sentence
+        else:
+            found[key] = bow
+
+    for key, bow in zip(list(missing), map_chunks(bow_chunk, list(missing.values()), processes, chunk_size)):
+        cache.put(key, bow)
+        found[key] = bow
+    cache.flush()
+    pipelineMetrics.count('text_cache_hits', cache.hits - hits)
+    pipelineMetrics.count('text_cache_disk_hits', cache.disk_hits - disk_hits)
+    pipelineMetrics.count('text_cache_misses', cache.misses - misses)
+    return [list(found[key]) for key in keys]
+
+# Single text version of preprocess_texts, a drop in for tweetProcessing.preprocess_gensim
+def preprocess_text(text, cache=None):
+    return preprocess_texts([text], processes=1, cache=cache)[0]
@@ -0,0 +1,168 @@
+import numpy as np
+from scipy import sparse
+
+# Compact storage for Bags of Words. Tokens are mapped to int32 ids by a shared Vocabulary (or a HashedVocabulary,
+# which needs no state and matches HashingVectorizer), and a TokenStore keeps every row's ids in one array with
+# CSR style offsets instead of a Python list of strings per row. count_matrix() gives the document-term matrix
+# the vectorizers would build, so TfidfTransformer or the classifiers can use it without re-tokenizing.
+
+class Vocabulary(object):
+
+    def __init__(self, tokens=()):
+        self.index = {}
+        self.tokens = []
+        self.ids(tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    # ids for a list of tokens, new tokens are added unless grow is False, in which case they get -1
+    def ids(self, tokens, grow=True):
+        ids = np.empty(len(tokens), dtype='int32')
+        for i, token in enumerate(tokens):
+            token_id = self.index.get(token)
+            if token_id is None:
+                if grow:
+                    token_id = len(self.tokens)
+                    self.index[token] = token_id
+                    self.tokens.append(token)
+                else:
+                    token_id = -1
+            ids[i] = token_id
+        return ids
+
+    def lookup(self, ids):
+        return [self.tokens[token_id] for token_id in ids]
+
+    @property
+    def n_features(self):
+        return len(self.tokens)
+
+# Stateless vocabulary, a token's id is its murmurhash modulo n_features the same way HashingVectorizer with
+# alternate_sign=False indexes features. Tokens are remembered only so ids can be turned back into words
+class HashedVocabulary(object):
+
+    def __init__(self, n_features=2**20, keep_tokens=True):
+        self.n_features = n_features
+        self.keep_tokens = keep_tokens
+        self.index = {}
+        self.tokens = {}
+
+    def __len__(self):
+        return self.n_features
+
+    def ids(self, tokens, grow=True):
+        # Imported here so importing tweetProcessing does not load scikit-learn
+        from sklearn.utils import murmurhash3_32
+        ids = np.empty(len(tokens), dtype='int32')
+        for i, token in enumerate(tokens):
+            token_id = self.index.get(token)
+            if token_id is None:
+                token_id = abs(murmurhash3_32(token, seed=0)) % self.n_features
+                self.index[token] = token_id
+                if self.keep_tokens:
+                    self.tokens.setdefault(token_id, token)
+            ids[i] = token_id
+        return ids
+
+    def lookup(self, ids):
+        return [self.tokens.get(token_id) for token_id in ids]
+
+class TokenStore(object):
+
+    def __init__(self, offsets, ids, vocabulary):
+        self.offsets = np.asarray(offsets, dtype='int64')
+        self.ids = np.asarray(ids, dtype='int32')
+        self.vocabulary = vocabulary
+
+    # Build a store from an iterable of token lists, e.g. the BoW column of process_tweets
+    @classmethod
+    def from_bows(cls, bows, vocabulary=None):
+        if vocabulary is None:
+            vocabulary = Vocabulary()
+        lengths = []
+        chunks = []
+        for bow in bows:
+            if not isinstance(bow, (list, tuple, np.ndarray)):
+                bow = []
+            chunks.append(vocabulary.ids(bow))
+            lengths.append(len(bow))
+        offsets = np.zeros(len(lengths) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        ids = np.concatenate(chunks) if chunks else np.zeros(0, dtype='int32')
+        return cls(offsets, ids, vocabulary)
+
+    # Rows of several stores that share one vocabulary, one store after the other
+    @classmethod
+    def concat(cls, stores, vocabulary):
+        stores = list(stores)
+        if not stores:
+            return cls(np.zeros(1, dtype='int64'), np.zeros(0, dtype='int32'), vocabulary)
+        lengths = np.concatenate([store.lengths() for store in stores])
+        offsets = np.zeros(len(lengths) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(offsets, np.concatenate([store.ids for store in stores]), vocabulary)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.ids[self.offsets[row]:self.offsets[row + 1]]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def tokens(self, row):
+        return self.vocabulary.lookup(self[row])
+
+    def to_bows(self):
+        return [self.tokens(row) for row in range(len(self))]
+
+    # Space joined strings, the toList=False format of process_users
+    def to_strings(self):
+        return [' '.join(bow) for bow in self.to_bows()]
+
+    # Concatenate the rows that belong to each of n groups, keeping row order within a group. Rows with a
+    # negative code are left out, so process_users can be done as group(user codes of the English tweets)
+    def group(self, codes, n):
+        codes = np.asarray(codes, dtype='int64')
+        lengths = self.lengths()
+        selected = codes >= 0
+        group_lengths = np.bincount(codes[selected], weights=lengths[selected], minlength=n).astype('int64')
+        token_codes = np.repeat(np.where(selected, codes, n), lengths)
+        order = np.argsort(token_codes, kind='stable')[:group_lengths.sum()]
+        offsets = np.zeros(n + 1, dtype='int64')
+        np.cumsum(group_lengths, out=offsets[1:])
+        return TokenStore(offsets, self.ids[order], self.vocabulary)
+
+    # Rows by a list of positions, e.g. a train/test split
+    def take(self, rows):
+        rows = np.asarray(rows, dtype='int64')
+        lengths = self.lengths()[rows]
+        offsets = np.zeros(len(rows) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        starts = np.repeat(self.offsets[rows] - offsets[:-1], lengths)
+        return TokenStore(offsets, self.ids[starts + np.arange(offsets[-1])], self.vocabulary)
+
+    # Document-term count matrix with a column per token id, the same counts CountVectorizer would give
+    def count_matrix(self, n_features=None, dtype='float64'):
+        if n_features is None:
+            n_features = self.vocabulary.n_features
+        known = self.ids >= 0
+        rows = np.repeat(np.arange(len(self)), self.lengths())[known]
+        matrix = sparse.csr_matrix((np.ones(known.sum(), dtype=dtype), (rows, self.ids[known])),
+                                   shape=(len(self), n_features))
+        matrix.sum_duplicates()
+        return matrix
+
+    # Save the offsets, ids and a plain vocabulary's tokens to an .npz file
+    def save(self, path):
+        tokens = self.vocabulary.tokens if isinstance(self.vocabulary, Vocabulary) else []
+        np.savez_compressed(path, offsets=self.offsets, ids=self.ids, tokens=np.array(tokens, dtype=str))
+
+    @classmethod
+    def load(cls, path, vocabulary=None):
+        stored = np.load(path)
+        if vocabulary is None:
+            vocabulary = Vocabulary([str(token) for token in stored['tokens']])
+        return cls(stored['offsets'], stored['ids'], vocabulary)
@@ -12,7 +12,163 @@ import tweepy
 import pandas as pd
 import datetime
 import json
+import gzip
 import time
+from typing import Any, NamedTuple
+from tweepy.utils import parse_datetime, parse_html_value
+try:
+    from . import frameStorage, pipelineMetrics
+except ImportError:
+    import frameStorage, pipelineMetrics
+
+# Formatted profile information from a user JSON payload, the same fields mine_user_info collects
+def format_user(user):
+    return {
+        'userid':                    user['id'],
+        'user_display_name':         user['name'],
+        'user_screen_name':          user['screen_name'],
+        'user_reported_location':    user['location'],
+        'user_profile_description':  user['description'],
+        'user_profile_url':          user['url'],
+        'follower_count':            user['followers_count'],
+        'following_count':           user['friends_count'],
+        'account_creation_date':     parse_datetime(user['created_at']),
+        'account_language':          user.get('lang')
+    }
+
+# Key a looked up user is matched on, screen names are case insensitive
+def user_key(kind, name):
+    return str(name) if kind == 'user_ids' else str(name).lower()
+
+# Twitter error codes that will not go away on a retry: page does not exist, account suspended and not authorized
+# to see the status
+PERMANENT_ERROR_CODES = (34, 63, 179)
+
+# Whether a failed request is worth retrying: a server error or a request that never got a response. Anything else,
+# e.g. 401/403/404 for protected, suspended or deleted accounts, fails the same way every time
+def transient_error(error):
+    if error.api_code in PERMANENT_ERROR_CODES:
+        return False
+    if error.response is None:
+        return error.reason.startswith('Failed to send request')
+    return error.response.status_code >= 500
+
+# One mined tweet, the columns of the information operations datasets in the order the mining methods give them
+class TweetRecord(NamedTuple):
+    tweetid: int
+    userid: int
+    user_display_name: str
+    user_screen_name: str
+    user_reported_location: str
+    user_profile_description: str
+    user_profile_url: Any
+    follower_count: int
+    following_count: int
+    account_creation_date: datetime.datetime
+    account_language: Any
+    tweet_language: Any
+    tweet_text: str
+    tweet_time: datetime.datetime
+    tweet_client_name: str
+    in_reply_to_userid: Any
+    in_reply_to_tweetid: Any
+    quoted_tweet_tweetid: Any
+    is_retweet: bool
+    retweet_userid: Any
+    retweet_tweetid: Any
+    latitude: Any
+    longitude: Any
+    quote_count: int
+    reply_count: Any
+    like_count: int
+    retweet_count: int
+    hashtags: Any
+    urls: Any
+    user_mentions: Any
+
+TWEET_COLUMNS = list(TweetRecord._fields)
+
+# Record of a status JSON payload (a tweepy Status keeps it in _json). count_entities stores the number of
+# hashtags, urls and user mentions instead of the entity lists, which is what Step3 turns those columns into
+def status_record(status, count_entities=False):
+    user = status['user']
+    text = status.get('full_text') or status.get('text', '')
+    source = status.get('source', '')
+    if '<' in source:
+        source = parse_html_value(source)
+    retweeted = status.get('retweeted_status')
+    entities = status.get('entities', {})
+    if count_entities:
+        hashtags = len(entities.get('hashtags', ()))
+        urls = len(entities.get('urls', ()))
+        user_mentions = len(entities.get('user_mentions', ()))
+    else:
+        hashtags = entities.get('hashtags', [])
+        urls = entities.get('urls', [])
+        user_mentions = entities.get('user_mentions', [])
+    return TweetRecord(
+        status['id'],
+        user['id'],
+        user['name'],
+        user['screen_name'],
+        user['location'],
+        user['description'],
+        user['url'],
+        user['followers_count'],
+        user['friends_count'],
+        parse_datetime(user['created_at']),
+        user.get('lang'),
+        status.get('lang'),
+        text,
+        parse_datetime(status['created_at']),
+        source,
+        status.get('in_reply_to_user_id'),
+        status.get('in_reply_to_status_id'),
+        status.get('quoted_status_id', 'None'),
+        'RT' in text,
+        retweeted['user']['id'] if retweeted else 'None',
+        retweeted['id'] if retweeted else 'None',
+        'absent',
+        'absent',
+        status.get('retweet_count'),
+        None,
+        status.get('favorite_count'),
+        status.get('retweet_count'),
+        hashtags,
+        urls,
+        user_mentions,
+    )
+
+# Formatted tweet as a dict, the format the tweet mining methods return
+def format_status(status, count_entities=False):
+    return status_record(status, count_entities)._asdict()
+
+# Typed tweet frame from a list of records or formatted tweets, with the column types frameStorage stores
+def records_frame(records):
+    df = pd.DataFrame.from_records(records, columns=TWEET_COLUMNS)
+    return frameStorage.typed_frame(df)
+
+# Writes raw JSON payloads one per line, gzip compressed if the path ends in .gz. Files are appended to, so a sink
+# can be reopened on the same file
+class JSONLSink(object):
+
+    def __init__(self, path, compresslevel=6):
+        if path.endswith('.gz'):
+            self.file = gzip.open(path, 'at', compresslevel=compresslevel, encoding='utf-8')
+        else:
+            self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, payload):
+        self.file.write(json.dumps(payload, separators=(',', ':')) + '\n')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 class TweetMiner(object):
 
@@ -28,7 +184,9 @@ class TweetMiner(object):
     }
     
     
-    def __init__(self, keys_dict=twitter_keys, api=api, result_limit = 20):
+    # count_entities stores the number of hashtags, urls and user mentions instead of the entity lists, which is
+    # what Step3 turns those columns into
+    def __init__(self, keys_dict=twitter_keys, api=api, result_limit = 20, count_entities=False):
         
         self.twitter_keys = keys_dict
         
@@ -39,7 +197,21 @@ class TweetMiner(object):
         self.twitter_keys = keys_dict
         
         self.result_limit = result_limit
+        self.count_entities = count_entities
+
 
+    # One API call, its latency is recorded under endpoint when pipelineMetrics is enabled
+    def call(self, endpoint, method, **params):
+        start = time.perf_counter()
+        try:
+            return method(**params)
+        finally:
+            pipelineMetrics.observe_request(endpoint, time.perf_counter() - start)
+
+    # Sleep until the 15 minute query quota resets
+    def rate_limit_wait(self, endpoint, seconds=60*16):
+        pipelineMetrics.observe_wait(endpoint, seconds)
+        time.sleep(seconds)
 
     # Queries profile information and returns a list of formatted information and raw information. 
     # If 15 minute query quota reach, script sleeps for 15 minutes and resumes queries
@@ -50,44 +222,18 @@ class TweetMiner(object):
 
         for name in users:
             try:
-                user_info = self.api.get_user(id=name)
+                user_info = self.call('get_user', self.api.get_user, id=name)
                 print('Mining ', name)
-                mined = {
-                    'userid':                    user_info.id,
-                    'user_display_name':         user_info.name,
-                    'user_screen_name':          user_info.screen_name,
-                    'user_reported_location':    user_info.location,
-                    'user_profile_description':  user_info.description,
-                    'user_profile_url':          user_info.url,
-                    'follower_count':            user_info.followers_count,
-                    'following_count':           user_info.friends_count,
-                    'account_creation_date':     user_info.created_at,
-                    'account_language':          user_info.lang   
-                }
-
-                data.append(mined)
+                data.append(format_user(user_info._json))
                 raw_data.append(user_info)
             except tweepy.error.RateLimitError:
                 print('15 minute query limit reached, wait 15 minutes until query resumes')
                 print('Have executed' + str(users.index(name)) + ' of ' + str(len(users)) + ' total user queries.')
-                time.sleep(60*16)
+                self.rate_limit_wait('get_user')
                 print('Query resumed')
-                user_info = self.api.get_user(id=name)
+                user_info = self.call('get_user', self.api.get_user, id=name)
                 print('Mining ', name)
-                mined = {
-                    'userid':                    user_info.id,
-                    'user_display_name':         user_info.name,
-                    'user_screen_name':          user_info.screen_name,
-                    'user_reported_location':    user_info.location,
-                    'user_profile_description':  user_info.description,
-                    'user_profile_url':          user_info.url,
-                    'follower_count':            user_info.followers_count,
-                    'following_count':           user_info.friends_count,
-                    'account_creation_date':     user_info.created_at,
-                    'account_language':          user_info.lang 
-                }
-                
-                data.append(mined)
+                data.append(format_user(user_info._json))
                 raw_data.append(user_info)
 
             except tweepy.error.TweepError:
@@ -96,171 +242,70 @@ class TweetMiner(object):
 
         return data, raw_data, usersnotfound
 
+    # Batched version of mine_user_info, looks up to batch_size users (100 is the API maximum) per users/lookup
+    # call instead of one call per user. User ids and screen names are given separately, a screen name may be all
+    # digits. Returns the formatted and raw information in input order, ids first, and the list of users that were
+    # not found. A user missing from a lookup, or in a lookup that failed, is looked up again with the other
+    # remaining users up to retries times.
+    def mine_user_info_batched(self, user_ids=[], screen_names=[], batch_size=100, retries=3):
+        data           =  []
+        raw_data       =  []
+        usersnotfound  =  []
+
+        found = {}
+        attempts = {}
+        for kind, users in (('user_ids', user_ids), ('screen_names', screen_names)):
+            pending = list(dict.fromkeys(user_key(kind, name) for name in users))
+            while pending:
+                batch, pending = pending[:batch_size], pending[batch_size:]
+                print('Mining ' + str(len(batch)) + ' users')
+                try:
+                    user_infos = self.call('lookup_users', self.api.lookup_users, **{kind: batch})
+                except tweepy.error.RateLimitError:
+                    print('15 minute query limit reached, wait 15 minutes until query resumes')
+                    self.rate_limit_wait('lookup_users')
+                    print('Query resumed')
+                    pending = batch + pending
+                    continue
+                except tweepy.error.TweepError as e:
+                    # Code 17 means none of the users in the batch exist
+                    if e.api_code == 17:
+                        continue
+                    print('Lookup failed for ' + str(len(batch)) + ' users: ' + str(e))
+                    user_infos = []
+                for user_info in user_infos:
+                    found[(kind, user_key(kind, user_info.id_str if kind == 'user_ids' else
+                                          user_info.screen_name))] = user_info
+                for key in batch:
+                    if (kind, key) not in found:
+                        attempts[(kind, key)] = attempts.get((kind, key), 0) + 1
+                        if attempts[(kind, key)] <= retries:
+                            pending.append(key)
+
+        for kind, users in (('user_ids', user_ids), ('screen_names', screen_names)):
+            for name in users:
+                user_info = found.get((kind, user_key(kind, name)))
+                if user_info is None:
+                    usersnotfound.append(name)
+                    continue
+                data.append(format_user(user_info._json))
+                raw_data.append(user_info)
+
+        return data, raw_data, usersnotfound
+
     # Query tweets by topic, returns specified number of tweets or pages by topic search. Returns list of 
     # formatted tweets and a list of all raw data. If 15 minute quota reached, the script sleeps for 15 minutes and
     # resumes queries.
     def mine_topical_tweets(self, topic="", mine_retweets=False, max_pages=5):
         data           =  []
         raw_data       =  []
-        last_tweet_id  =  False
-        page           =  1
         print('Mining ', topic)
-        while page <= max_pages:
-            try:
-                if last_tweet_id:
-                    statuses   =   self.api.search(q=topic,
-                                                        count=self.result_limit,
-                                                        max_id=last_tweet_id - 1,
-                                                        tweet_mode = 'extended',
-                                                        include_retweets=True
-                                                        )        
-                else:
-                    statuses   =   self.api.search(q=topic,
-                                                            count=self.result_limit,
-                                                            tweet_mode = 'extended',
-                                                            include_retweets=True)
-                print('    Mining ' + str(page) + ' of '+ str(max_pages) +' total pages')
-                for item in statuses:
-                    
-                    RT = False
-                    if 'RT' in item.full_text: 
-                        RT = True
-
-                    mined = {
-                        'tweetid':         item.id,
-                        'userid':          item.user.id,
-                        'user_display_name':         item.user.name,
-                        'user_screen_name':          item.user.screen_name,
-                        'user_reported_location':    item.user.location,
-                        'user_profile_description':  item.user.description,
-                        'user_profile_url':          item.user.url,
-                        'follower_count':            item.user.followers_count,
-                        'following_count':           item.user.friends_count,
-                        'account_creation_date':     item.user.created_at,
-                        'account_language':          item.user.lang,
-                        'tweet_language':            item.lang,
-                        'tweet_text':            item.full_text,
-                        'tweet_time':      item.created_at,
-                        'tweet_client_name':   item.source,
-                        'in_reply_to_userid':        item.in_reply_to_user_id,
-                        'in_reply_to_tweetid':       item.in_reply_to_status_id
-                    }
-                    try:
-                        mined['quoted_tweet_tweetid'] = item.quoted_status_id
-                        
-                    except:
-                        mined['quoted_tweet_tweetid'] = 'None'
-
-                    mined.update({'is_retweet': RT})
-
-                    try:
-                        mined['retweet_userid']  = item.retweeted_status.user.id
-                        mined['retweet_tweetid'] = item.retweeted_status.id
-                        
-                    except:
-                        mined['retweet_userid']  = 'None'
-                        mined['retweet_tweetid'] = 'None'
-
-                    mined.update({
-
-                        'latitude':       'absent',
-                        'longitude':      'absent',
-                        'quote_count':     item.retweet_count,
-                        'reply_count':    None,
-                        'like_count':      item.favorite_count,
-                        'retweet_count':   item.retweet_count,
-                        'hashtags':        item.entities['hashtags'],
-                        'urls':            item.entities['urls'],
-                        'user_mentions':   item.entities['user_mentions']
-                    })
-                    
-                    last_tweet_id = item.id
-                    data.append(mined)
-                    raw_data.append(item)
-                    
-                page += 1
-            
-            except tweepy.error.RateLimitError:
-                print('15 minute query limit reached, wait 15 minutes until query resumes')
-                print(str(page) + ' pages of '+ str(max_pages) +' total pages have been queried')
-                time.sleep(60*16) 
-                print('Query resumed')
-                if last_tweet_id:
-                    statuses   =   self.api.search(q=topic,
-                                                        count=self.result_limit,
-                                                        max_id=last_tweet_id - 1,
-                                                        tweet_mode = 'extended',
-                                                        include_retweets=True
-                                                        )        
-                else:
-                    statuses   =   self.api.search(q=topic,
-                                                            count=self.result_limit,
-                                                            tweet_mode = 'extended',
-                                                            include_retweets=True)
-                print('    Mining ' + str(page) + ' of '+ str(max_pages) +' total pages')
-                for item in statuses:
-                    
-                    RT = False
-                    if 'RT' in item.full_text: 
-                        RT = True
-
-                    mined = {
-                        'tweetid':         item.id,
-                        'userid':          item.user.id,
-                        'user_display_name':         item.user.name,
-                        'user_screen_name':          item.user.screen_name,
-                        'user_reported_location':    item.user.location,
-                        'user_profile_description':  item.user.description,
-                        'user_profile_url':          item.user.url,
-                        'follower_count':            item.user.followers_count,
-                        'following_count':           item.user.friends_count,
-                        'account_creation_date':     item.user.created_at,
-                        'account_language':          item.user.lang,
-                        'tweet_language':            item.lang,
-                        'tweet_text':            item.full_text,
-                        'tweet_time':      item.created_at,
-                        'tweet_client_name':   item.source,
-                        'in_reply_to_userid':        item.in_reply_to_user_id,
-                        'in_reply_to_tweetid':       item.in_reply_to_status_id
-                    }
-                    try:
-                        mined['quoted_tweet_tweetid'] = item.quoted_status_id
-                        
-                    except:
-                        mined['quoted_tweet_tweetid'] = 'None'
-
-                    mined.update({'is_retweet': RT})
-
-                    try:
-                        mined['retweet_userid']  = item.retweeted_status.user.id
-                        mined['retweet_tweetid'] = item.retweeted_status.id
-                        
-                    except:
-                        mined['retweet_userid']  = 'None'
-                        mined['retweet_tweetid'] = 'None'
-
-                    mined.update({
-
-                        'latitude':       None,
-                        'longitude':      None,
-                        'quote_count':     item.retweet_count,
-                        'reply_count':    None,
-                        'like_count':      item.favorite_count,
-                        'retweet_count':   item.retweet_count,
-                        'hashtags':        item.entities['hashtags'],
-                        'urls':            item.entities['urls'],
-                        'user_mentions':   item.entities['user_mentions']
-                    })
-                    
-                    last_tweet_id = item.id
-                    data.append(mined)
-                    
-                page += 1
-            
-            except tweepy.error.TweepError:
-                break
+        for statuses in self.status_pages('search', max_pages, q=topic):
+            for item in statuses:
+                data.append(format_status(item._json, self.count_entities))
+                raw_data.append(item)
 
-        return data, raw_data        
+        return data, raw_data
 
     # Query tweets by user, returns specified number of tweets or pages by topic search. Returns list of 
     # formatted tweets and a list of all raw data. If 15 minute quota reached, the script sleeps for 15 minutes and
@@ -268,178 +313,70 @@ class TweetMiner(object):
     def mine_user_tweets(self, user="", #BECAUSE WHO ELSE!
                          mine_rewteets=False,
                          max_pages=5):
-
         data           =  []
         raw_data       =  []
+        print('Mining ', user)
+        for statuses in self.status_pages('user_timeline', max_pages, screen_name=user):
+            for item in statuses:
+                data.append(format_status(item._json, self.count_entities))
+                raw_data.append(item)
+
+        return data, raw_data
+
+    # Pages of tweepy Status objects from a search or user timeline query, each page asks for tweets older than the
+    # last one of the previous page. method is a tweepy API method or its name, e.g. 'search'. If 15 minute quota
+    # reached, sleeps for 15 minutes and resumes queries.
+    def status_pages(self, method, max_pages=5, **params):
+        endpoint = method if isinstance(method, str) else getattr(method, '__name__', 'api')
+        if isinstance(method, str):
+            method = getattr(self.api, method)
         last_tweet_id  =  False
         page           =  1
-        print('Mining ', user)
         while page <= max_pages:
-
+            if last_tweet_id:
+                params['max_id'] = last_tweet_id - 1
             try:
-                if last_tweet_id:
-                    statuses   =   self.api.user_timeline(screen_name=user,
-                                                        count=self.result_limit,
-                                                        max_id=last_tweet_id - 1,
-                                                        tweet_mode = 'extended',
-                                                        include_retweets=True
-                                                        )        
-                else:
-                    statuses   =   self.api.user_timeline(screen_name=user,
-                                                            count=self.result_limit,
-                                                            tweet_mode = 'extended',
-                                                            include_retweets=True)
-                print('    Mining ' + str(page) + ' of '+ str(max_pages) +' total pages')   
-                for item in statuses:
-
-                    RT = False
-                    if 'RT' in item.full_text: 
-                        RT = True
-
-                    mined = {
-                        'tweetid':         item.id,
-                        'userid':          item.user.id,
-                        'user_display_name':         item.user.name,
-                        'user_screen_name':          item.user.screen_name,
-                        'user_reported_location':    item.user.location,
-                        'user_profile_description':  item.user.description,
-                        'user_profile_url':          item.user.url,
-                        'follower_count':            item.user.followers_count,
-                        'following_count':           item.user.friends_count,
-                        'account_creation_date':     item.user.created_at,
-                        'account_language':          item.user.lang,
-                        'tweet_language':            item.lang,
-                        'tweet_text':            item.full_text,
-                        'tweet_time':      item.created_at,
-                        'tweet_client_name':   item.source,
-                        'in_reply_to_userid':        item.in_reply_to_user_id,
-                        'in_reply_to_tweetid':       item.in_reply_to_status_id
-                    }
-                    try:
-                        mined['quoted_tweet_tweetid'] = item.quoted_status_id
-                        
-                    except:
-                        mined['quoted_tweet_tweetid'] = 'None'
-
-                    mined.update({'is_retweet': RT})
-
-                    try:
-                        mined['retweet_userid']  = item.retweeted_status.user.id
-                        mined['retweet_tweetid'] = item.retweeted_status.id
-                        
-                    except:
-                        mined['retweet_userid']  = 'None'
-                        mined['retweet_tweetid'] = 'None'
-
-                    mined.update({
-
-                        'latitude':       None,
-                        'longitude':      None,
-                        'quote_count':     item.retweet_count,
-                        'reply_count':    None,
-                        'like_count':      item.favorite_count,
-                        'retweet_count':   item.retweet_count,
-                        'hashtags':        item.entities['hashtags'],
-                        'urls':            item.entities['urls'],
-                        'user_mentions':   item.entities['user_mentions']
-                    })
-                    
-                    last_tweet_id = item.id
-                    data.append(mined)
-                    raw_data.append(item)
-                    
-                page += 1
-            
+                statuses = self.call(endpoint, method, count=self.result_limit, tweet_mode='extended',
+                                     include_retweets=True, **params)
             except tweepy.error.RateLimitError:
                 print('15 minute query limit reached, wait 15 minutes until query resumes')
-                print(str(page) + ' pages of '+ str(max_pages) +' total pages have been queried')
-                time.sleep(60*16) 
+                print(str(page - 1) + ' pages of '+ str(max_pages) +' total pages have been queried')
+                self.rate_limit_wait(endpoint)
                 print('Query resumed')
-                if last_tweet_id:
-                    statuses   =   self.api.user_timeline(screen_name=user,
-                                                        count=self.result_limit,
-                                                        max_id=last_tweet_id - 1,
-                                                        tweet_mode = 'extended',
-                                                        include_retweets=True
-                                                        )        
-                else:
-                    statuses   =   self.api.user_timeline(screen_name=user,
-                                                            count=self.result_limit,
-                                                            tweet_mode = 'extended',
-                                                            include_retweets=True)
-
-                print('    Mining ' + str(page) + ' of '+ str(max_pages) +' total pages')    
-                for item in statuses:
-
-                    RT = False
-                    if 'RT' in item.full_text: 
-                        RT = True
-
-                    mined = {
-                        'tweetid':         item.id,
-                        'userid':          item.user.id,
-                        'user_display_name':         item.user.name,
-                        'user_screen_name':          item.user.screen_name,
-                        'user_reported_location':    item.user.location,
-                        'user_profile_description':  item.user.description,
-                        'user_profile_url':          item.user.url,
-                        'follower_count':            item.user.followers_count,
-                        'following_count':           item.user.friends_count,
-                        'account_creation_date':     item.user.created_at,
-                        'account_language':          item.user.lang,
-                        'tweet_language':            item.lang,
-                        'tweet_text':            item.full_text,
-                        'tweet_time':      item.created_at,
-                        'tweet_client_name':   item.source,
-                        'in_reply_to_userid':        item.in_reply_to_user_id,
-                        'in_reply_to_tweetid':       item.in_reply_to_status_id
-                    }
-                    try:
-                        mined['quoted_tweet_tweetid'] = item.quoted_status_id
-                        
-                    except:
-                        mined['quoted_tweet_tweetid'] = 'None'
-
-                    mined.update({'is_retweet': RT})
-
-                    try:
-                        mined['retweet_userid']  = item.retweeted_status.user.id
-                        mined['retweet_tweetid'] = item.retweeted_status.id
-                        
-                    except:
-                        mined['retweet_userid']  = 'None'
-                        mined['retweet_tweetid'] = 'None'
-
-                    mined.update({
-
-                        'latitude':       None,
-                        'longitude':      None,
-                        'quote_count':     item.retweet_count,
-                        'reply_count':    None,
-                        'like_count':      item.favorite_count,
-                        'retweet_count':   item.retweet_count,
-                        'hashtags':        item.entities['hashtags'],
-                        'urls':            item.entities['urls'],
-                        'user_mentions':   item.entities['user_mentions']
-                    })
-                    
-                    last_tweet_id = item.id
-                    data.append(mined)
-                    raw_data.append(item)
-                    
-                page += 1
-
+                continue
             except tweepy.error.TweepError:
                 break
-            
-        return data, raw_data
+            if not statuses:
+                break
+            print('    Mining ' + str(page) + ' of '+ str(max_pages) +' total pages')
+            last_tweet_id = statuses[-1].id
+            yield statuses
+            page += 1
+
+    # Generator versions of the tweet mining methods. Each page is yielded as a list of formatted tweets as soon as
+    # it arrives, and its raw JSON goes to raw_sink (e.g. a JSONLSink) if one is given, so nothing is kept once the
+    # page has been consumed.
+    def iter_pages(self, method, max_pages=5, raw_sink=None, **params):
+        for statuses in self.status_pages(method, max_pages, **params):
+            mined = []
+            for item in statuses:
+                mined.append(format_status(item._json, self.count_entities))
+                if raw_sink is not None:
+                    raw_sink.write(item._json)
+            yield mined
+
+    def iter_topical_tweets(self, topic="", max_pages=5, raw_sink=None):
+        print('Mining ', topic)
+        return self.iter_pages('search', max_pages, raw_sink, q=topic)
+
+    def iter_user_tweets(self, user="", max_pages=5, raw_sink=None):
+        print('Mining ', user)
+        return self.iter_pages('user_timeline', max_pages, raw_sink, screen_name=user)
 
     # Takes responses from above functions, returns the formatted json in prettyprint
     def formatRawTweet(self, raw_tweets):
         formatted_raw_tweets = []
         for obj in raw_tweets:
-            json_str = json.dumps(obj._json)
-            parsed = json.loads(json_str)
-            formatted_raw_tweets.append(json.dumps(parsed, indent=4, sort_keys=True))
+            formatted_raw_tweets.append(json.dumps(obj._json, indent=4, sort_keys=True))
 
         return formatted_raw_tweets
\ No newline at end of file
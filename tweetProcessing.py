@@ -1,25 +1,26 @@
 import pandas as pd
+import numpy as np
 from numpy import NaN
+from scipy import sparse
 import re
-import gensim
-from gensim.utils import simple_preprocess
-from gensim.parsing.preprocessing import STOPWORDS
-from nltk.stem import WordNetLemmatizer
+import os
 from collections import Counter
-from nltk.tag import pos_tag
-from nltk.tokenize import WhitespaceTokenizer
 import statistics
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.feature_extraction.text import CountVectorizer
 from cmath import rect, phase
 from math import radians, degrees
-from sklearn.naive_bayes import MultinomialNB
 #from scipy.stats import mode
 from collections import Counter
 import json
 from json import JSONDecodeError
+try:
+    from . import circularStatistics, ensembleVoting, pipelineMetrics, rateStatistics, textPreprocessing, tokenStore, \
+        userFeatureState
+except ImportError:
+    import circularStatistics, ensembleVoting, pipelineMetrics, rateStatistics, textPreprocessing, tokenStore, \
+        userFeatureState
 
 # Calculate ratio of retweets to original tweets
+@pipelineMetrics.timed
 def retweetRatio(user_df, tweet_df):
     users = list(user_df.loc[:,'userid'].unique())
     rt_ratios = []
@@ -35,6 +36,7 @@ def retweetRatio(user_df, tweet_df):
     user_df.loc[:,'retweet_ratio'] = rt_ratios
 
 # Calculate proportion of English language tweets
+@pipelineMetrics.timed
 def englishRatio(user_df, tweet_df):
     users = list(user_df.loc[:,'userid'].unique())
     en_ratios = []
@@ -50,6 +52,7 @@ def englishRatio(user_df, tweet_df):
     user_df.loc[:,'english_tweet_proportion'] = en_ratios
 
 # Calculate average number of tweets per hour/day
+@pipelineMetrics.timed
 def averageTweetNum(user_df, tweet_df):
     users = list(user_df.loc[:,'userid'].unique())
     avg_hour_list = []
@@ -84,7 +87,23 @@ def averageTweetNum(user_df, tweet_df):
     user_df.loc[:,'avg_tweets_per_hour'] = avg_hour_list
     user_df.loc[:,'avg_tweets_per_min'] = avg_min_list
 
+# Vectorized averageTweetNum for all users at once, see rateStatistics. windows maps column names to pd.Grouper
+# frequencies, occupancy also adds <column>_active with the average number of tweets per non-empty bin
+@pipelineMetrics.timed
+def tweetRateStatistics(user_df, tweet_df, windows=rateStatistics.RATE_WINDOWS, occupancy=False):
+    users, codes = user_codes(user_df, tweet_df)
+    tweet_time = pd.to_datetime(tweet_df.loc[:,'tweet_time'])
+    dated = (codes >= 0) & (tweet_time.notna() & (tweet_time != '1900-01-01 00:00')).to_numpy()
+    stamps = tweet_time.to_numpy()[dated].astype('datetime64[ns]').astype('int64')
+    counted = tweet_df.loc[:,'tweetid'].notna().to_numpy()[dated]
+    rates = rateStatistics.segment_rate_statistics(codes[dated], stamps, counted, len(users), windows, occupancy)
+
+    rows = users.get_indexer(user_df.loc[:,'userid'])
+    for column, values in rates.items():
+        user_df.loc[:,column] = values[rows]
+
 # Average quotes, likes, retweet, hashtags, urls, user mentions per tweet
+@pipelineMetrics.timed
 def avgTweetMetrics(user_df, tweet_df):
     users = list(user_df.loc[:,'userid'].unique())
     metric_columns = ['avg_quote_count', 'avg_like_count', 'avg_retweet_count', 'avg_hashtags', 'avg_urls', 'avg_user_mentions']
@@ -104,7 +123,8 @@ def avgTweetMetrics(user_df, tweet_df):
     user_df.loc[:, metric_columns] = metric_df
 
 # Proportion of tweet clients for most used twitter clients
-# This is currently not being used, because it makes the dataframe too large for RAM
+# This is currently not being used, because it makes the dataframe too large for RAM, see tweetClientMatrix
+@pipelineMetrics.timed
 def tweetClientProportion(user_df, tweet_df):
     users = list(user_df.loc[:,'userid'].unique())
     client_names = tweet_df.columns[12:]
@@ -128,18 +148,92 @@ def tweetClientProportion(user_df, tweet_df):
 
     user_df.loc[:,client_names] = client_df
 
+# Sparse version of tweetClientProportion built straight from tweet_client_name. Returns a CSR matrix with a row
+# per user_df row and a column per client holding the proportion of the user's tweets sent from that client, and
+# the client names for the columns. top_k keeps only the k most used clients. The matrix can be hstacked with the
+# other model features without creating a dense column per client
+@pipelineMetrics.timed
+def tweetClientMatrix(user_df, tweet_df, top_k=None):
+    users, codes = user_codes(user_df, tweet_df)
+    n = len(users)
+    known = codes >= 0
+    codes = codes[known]
+    clients = pd.Categorical(tweet_df.loc[known, 'tweet_client_name'])
+    client_codes = clients.codes.astype('int64')
+    names = clients.categories
+    if top_k is not None:
+        totals = np.bincount(client_codes[client_codes >= 0], minlength=len(names))
+        keep = np.argsort(-totals, kind='stable')[:top_k]
+        remap = np.full(len(names) + 1, -1)
+        remap[keep] = np.arange(len(keep))
+        client_codes = remap[client_codes]
+        names = names[keep]
+
+    # Tweets without a client still count towards the user's total, as they do in the one-hot columns
+    tweet_num = np.bincount(codes, minlength=n)
+    has_client = client_codes >= 0
+    proportions = 1. / tweet_num[codes[has_client]]
+    matrix = sparse.csr_matrix((proportions, (codes[has_client], client_codes[has_client])), shape=(n, len(names)))
+    matrix.sum_duplicates()
+    return matrix[users.get_indexer(user_df.loc[:,'userid'])], list(names)
+
+# Key every entity of each type has once, counted by Step3 when an entity list is not valid JSON
+ENTITY_KEYS = {'hashtags': 'text', 'urls': 'url', 'user_mentions': 'screen_name'}
+INDICES_PATTERN = r"""['"]indices['"]\s*:"""
+
+# Count for one entity list string the way Step3 does it: swap quotes and parse as JSON (the legitimate tweets,
+# e.g. "['foo', 'bar']"). If that fails, count the entity key of truncated entity dicts, or split lists without
+# dicts on ', ' as Step3 does for the IO datasets' plain lists such as "[foo, bar]"
+def entity_count_fallback(entities, key):
+    swapped = entities.replace("'", '"')
+    try:
+        parsed = json.loads(swapped)
+        if isinstance(parsed, list):
+            return len(parsed)
+    except JSONDecodeError:
+        pass
+    if '{' in swapped:
+        return swapped.count('"' + key + '"')
+    items = entities.replace("'", '').strip().strip('][').split(', ')
+    return len([item for item in items if item.strip()])
+
+# Number of entities per tweet for a hashtags, urls or user_mentions column, as Step3 computes it. Entity lists
+# stored as strings are counted by their 'indices' keys, which every entity has exactly once, and only strings
+# that do not look like a complete list of entity dicts (or "[]") are parsed. Python lists are counted by length, numbers are
+# taken to be counts already and nulls count as 0
+def entityCount(entities, key):
+    counts = np.zeros(len(entities), dtype='int64')
+    kinds = entities.map(type).to_numpy()
+    is_text = kinds == str
+    is_list = kinds == list
+    is_number = entities.map(lambda x: isinstance(x, (int, float, np.integer, np.floating))).to_numpy() & entities.notna().to_numpy()
+
+    text = entities[is_text].str.strip()
+    indices = text.str.count(INDICES_PATTERN).to_numpy()
+    wellformed = (text.str.startswith('[') & text.str.endswith(']')).to_numpy() & \
+        (text.str.count(r'\{').to_numpy() == indices) & (text.str.count(r'\}').to_numpy() == indices) & \
+        ((indices > 0) | (text == '[]').to_numpy())
+    text_counts = indices.copy()
+    for i in np.flatnonzero(~wellformed):
+        text_counts[i] = entity_count_fallback(text.iat[i], key)
+    counts[is_text] = text_counts
+    counts[is_list] = entities[is_list].str.len().to_numpy()
+    counts[is_number] = entities[is_number].to_numpy(dtype='float64')
+    return counts
+
+# Replace the hashtags, urls and user_mentions columns with their entity counts, the columns avgTweetMetrics uses
+@pipelineMetrics.timed
+def countEntities(tweet_df, columns=ENTITY_KEYS):
+    for column in columns:
+        if column in tweet_df.columns:
+            tweet_df.loc[:,column] = entityCount(tweet_df.loc[:,column], ENTITY_KEYS[column])
+
+# The tagger, lemmatizer and gensim are loaded on first use by textPreprocessing.load_models, with the NLTK data
+# taken from its local cache
 def lemmatize_all(sentence):
-    wnl = WordNetLemmatizer()
-    for word, tag in pos_tag(WhitespaceTokenizer().tokenize(sentence)):
-        if tag.startswith("NN"):
-            yield wnl.lemmatize(word, pos='n')
-        elif tag.startswith('VB'):
-            yield wnl.lemmatize(word, pos='v')
-        elif tag.startswith('JJ'):
-            yield wnl.lemmatize(word, pos='a')
-        else:
-            yield word
-            
+    textPreprocessing.load_models()
+    return textPreprocessing.lemmatize_tagged(textPreprocessing.tagger.tag(sentence.split()))
+
 # Function to preprocess data with Gensim
 def preprocess_gensim(text):
     # Remove non-alphanumeric characters from data, remove URLs, remove retweet annotation and usernames
@@ -153,11 +247,12 @@ def preprocess_gensim(text):
     
     #print('lemmatizing')
     text = ' '.join(lemmatize_all(text))
-    tokens = [token for token in gensim.utils.simple_preprocess(text) 
-          if not token in gensim.parsing.preprocessing.STOPWORDS]
+    tokens = [token for token in textPreprocessing.simple_preprocess(text)
+          if not token in textPreprocessing.stopwords]
     #print(tokens)
     return tokens
 
+@pipelineMetrics.timed
 def process_users(user_df, tweet_df, toList):
     user_df.loc[:,'BoW'] = 'NaN'
     user_df.loc[:,'BoW'] = user_df.loc[:,'BoW']
@@ -172,22 +267,85 @@ def process_users(user_df, tweet_df, toList):
         bigBoW.append(flatBoW)
     user_df.loc[:,'BoW'] = bigBoW
 
-def process_tweets(tweet_df):
+# Token id version of the tweet BoW column, see tokenStore. Pass the vocabulary of another dataset to share ids
+def tweetTokenStore(tweet_df, vocabulary=None):
+    return tokenStore.TokenStore.from_bows(tweet_df.loc[:,'BoW'], vocabulary)
+
+# Token id version of process_users, the English tweets of every user_df row concatenated in tweet order
+def userTokenStore(user_df, tweet_df, tweet_store):
+    users = pd.Index(user_df.loc[:,'userid'])
+    codes = users.get_indexer(tweet_df.loc[:,'userid'])
+    codes[(tweet_df.loc[:,'tweet_language'] != 'en').to_numpy()] = -1
+    return tweet_store.group(codes, len(users))
+
+# processes sets the number of worker processes for preprocessing, None uses all cores. Duplicate texts are
+# only preprocessed once, pass a textPreprocessing.TextCache to share or persist the cache between calls
+@pipelineMetrics.timed
+def process_tweets(tweet_df, processes=1, cache=None):
     tweet_df.loc[:,'BoW'] = 'NaN'
     tweet_df.loc[:,'BoW'] = tweet_df.loc[:,'BoW'].astype('object')
-    BoW = [preprocess_gensim(tokens) for tokens in tweet_df['tweet_text']]
+    if cache is None:
+        cache = textPreprocessing.TextCache()
+    BoW = textPreprocessing.preprocess_texts(tweet_df['tweet_text'], processes=processes, cache=cache)
     #tweet_df['BoW'] = BoW
-    tweet_df.loc[:,'BoW'] = BoW
+    tweet_df.loc[:,'BoW'] = pd.Series(BoW, index=tweet_df.index, dtype='object')
 
-def preprocess_frame(tweet_df, user_df, toList=True):
-    process_tweets(tweet_df)
+@pipelineMetrics.timed
+def preprocess_frame(tweet_df, user_df, toList=True, processes=1, cache=None):
+    process_tweets(tweet_df, processes, cache)
     process_users(user_df, tweet_df, toList)
 
+# Streaming version of preprocess_frame for tweet files that do not fit in memory. Each file is read in chunks
+# of chunksize rows, prepare (if given) is applied to every chunk to do the cleaning done in the notebooks,
+# e.g. is_retweet to int, entity counts and tweet_time to datetime. The chunk's BoW is generated, appended to
+# tweet_output as CSV if a path is given, and folded into a UserFeatureState. At the end user_df gets the user
+# BoW and, when features is True, the pattern of life columns. Returns the state so it can be merged or kept.
+@pipelineMetrics.timed
+def preprocess_frame_stream(tweet_files, user_df, toList=True, chunksize=100000, tweet_output=None, prepare=None,
+                            features=True, en=True, non=True, processes=1, cache=None):
+    if isinstance(tweet_files, str):
+        tweet_files = [tweet_files]
+    if cache is None:
+        cache = textPreprocessing.TextCache()
+    state = userFeatureState.UserFeatureState(user_df.loc[:,'userid'].unique(), en, non)
+    header = True
+    for path in tweet_files:
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            if prepare is not None:
+                chunk = prepare(chunk)
+            process_tweets(chunk, processes, cache)
+            if tweet_output is not None:
+                chunk.to_csv(tweet_output, mode='w' if header else 'a', header=header, index=False)
+                header = False
+            with pipelineMetrics.stage('userFeatureState.update', len(chunk)):
+                if features:
+                    state.update(chunk)
+                else:
+                    state.update_bows(chunk)
+
+    state.apply(user_df, toList, features=features)
+    return state
+
+# Fold newly mined tweets into the user features saved at state_path (in .npz format, the path is used as given)
+# and write the updated BoW and pattern of life columns into user_df. tweet_df holds only the new tweets, already
+# cleaned and run through process_tweets. The state is created if the file does not exist yet and saved again
+# afterwards, so the tweet history is never re-read.
+@pipelineMetrics.timed
+def update_user_features(state_path, user_df, tweet_df, toList=True, en=True, non=True):
+    if os.path.exists(state_path):
+        state = userFeatureState.UserFeatureState.load(state_path)
+    else:
+        state = userFeatureState.UserFeatureState(en=en, non=non)
+    state.add_users(user_df.loc[:,'userid'])
+    state.update(tweet_df)
+    state.save(state_path)
+    state.apply(user_df, toList)
+    return state
+
+# Download the NLTK data preprocessing needs into textPreprocessing.NLTK_DATA_CACHE, e.g. before going offline.
+# Resources already there are not downloaded again, returns the ones that could not be found
 def download_wordlists():
-    from nltk import download
-    download('punkt')
-    download('wordnet')
-    download('averaged_perceptron_tagger')
+    return textPreprocessing.find_nltk_resources()
 
 #time functions adapted from:
 #from https://rosettacode.org/wiki/Averages/Mean_time_of_day#Python
@@ -231,6 +389,7 @@ def mode_dict(hours):
     return hourdict
         
 
+@pipelineMetrics.timed
 def tweet_time_statistics(tweet_df, user_df, en=True, non=False):
     users = list(user_df['userid'].unique())
     earliest_tweet = []
@@ -303,13 +462,77 @@ def tweet_time_statistics(tweet_df, user_df, en=True, non=False):
     for k in tweet_mode.keys():
         user_df.loc[:,"mode_" + str(k)] = tweet_mode[k]
     
-def predictionVoting(a, b, c):
-    votes = zip(a,b,c)
-    winner = [statistics.mode(x) for x in votes]
-    return winner
+# Position of each tweet's user in the list of unique users in user_df, tweets from unknown users get -1
+def user_codes(user_df, tweet_df):
+    users = pd.Index(user_df.loc[:,'userid'].unique())
+    codes = users.get_indexer(tweet_df.loc[:,'userid'])
+    return users, codes
+
+# Per-user sum and count of the non-null values, one bincount each instead of one scan per user
+def segment_mean(codes, values, n):
+    values = np.asarray(values, dtype='float64')
+    valid = ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=n)
+    counts = np.bincount(codes[valid], minlength=n)
+    means = np.full(n, NaN)
+    np.divide(sums, counts, out=means, where=counts > 0)
+    return means
+
+# Calculate every pattern of life feature in one pass over the tweets. Tweets are mapped to their user once
+# and each feature is a bincount/groupby over those codes, so the cost is linear in the number of tweets.
+# Columns and values match retweetRatio, englishRatio, tweet_time_statistics, averageTweetNum and
+# avgTweetMetrics run one after the other, en/non select the tweets used for the time statistics.
+@pipelineMetrics.timed
+def patternOfLife(user_df, tweet_df, en=True, non=True):
+    if not en and not non:
+        print("patternOfLife_error: one or both en/non must be true")
+        return
+
+    users, codes = user_codes(user_df, tweet_df)
+    n = len(users)
+    rows = users.get_indexer(user_df.loc[:,'userid'])
+    known = codes >= 0
+    codes = codes[known]
+    tweets = tweet_df.loc[known]
+    features = {}
+
+    # Retweet ratio
+    tweet_num = np.bincount(codes, minlength=n)
+    retweets = np.bincount(codes, weights=(tweets.loc[:,'is_retweet'].astype('int').to_numpy() == 1), minlength=n)
+    features['retweet_ratio'] = np.divide(retweets, tweet_num, out=np.zeros(n), where=tweet_num > 0)
+
+    # English tweet proportion, null languages are not counted as in value_counts
+    language = tweets.loc[:,'tweet_language']
+    has_language = language.notna().to_numpy()
+    language_num = np.bincount(codes[has_language], minlength=n)
+    english_num = np.bincount(codes[(language == 'en').to_numpy()], minlength=n)
+    features['english_tweet_proportion'] = np.divide(english_num, language_num, out=np.zeros(n), where=language_num > 0)
+
+    # Time statistics
+    tweet_time = pd.to_datetime(tweets.loc[:,'tweet_time'])
+    dated = (tweet_time.notna() & (tweet_time != '1900-01-01 00:00')).to_numpy()
+    selected = circularStatistics.time_statistics_mask(tweets, en, non)
+    hours, minutes = circularStatistics.hours_minutes(tweet_time)
+    features.update(circularStatistics.segment_time_statistics(codes[selected], hours[selected], minutes[selected], n))
+
+    # Tweet rate statistics
+    stamps = tweet_time.to_numpy()[dated].astype('datetime64[ns]').astype('int64')
+    counted = tweets.loc[:,'tweetid'].notna().to_numpy()[dated]
+    features.update(rateStatistics.segment_rate_statistics(codes[dated], stamps, counted, n))
+
+    # Tweet engagement metrics
+    for column, metric in [('avg_quote_count', 'quote_count'), ('avg_like_count', 'like_count'),
+                           ('avg_retweet_count', 'retweet_count'), ('avg_hashtags', 'hashtags'),
+                           ('avg_urls', 'urls'), ('avg_user_mentions', 'user_mentions')]:
+        features[column] = segment_mean(codes, tweets.loc[:,metric], n)
+
+    for column, values in features.items():
+        user_df.loc[:,column] = values[rows]
 
-#should run on import
-download_wordlists()
+# Majority vote of any number of models' predictions, ties go to the earliest model's vote as with statistics.mode.
+# See ensembleVoting for weighted and soft votes
+def predictionVoting(*predictions, weights=None, tie='first'):
+    return ensembleVoting.majority_vote(predictions, weights, tie).tolist()
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+try:
+    from . import streamingTraining
+except ImportError:
+    import streamingTraining
+
+# Tweet level scoring. Every tweet BoW from process_tweets is classified on its own, in vectorized batches, and the
+# per tweet log-odds of being part of an information operation are added up per user as tweets arrive. Tweets are
+# treated as independent evidence (naive Bayes), so a user's log-odds is the prior plus the sum of each tweet's
+# log-odds minus the prior. A user is decided as soon as at least min_tweets have been seen and the log-odds pass
+# threshold either way, so accounts can be flagged after a handful of tweets instead of after their full history.
+# A tweet model can be trained with streamingTraining.StreamingClassifier on the tweet frame's BoW and info_op.
+
+# Log-odds of the positive class for a batch of feature rows, from predict_proba when the model has it and from
+# the decision function otherwise (e.g. SGDClassifier with hinge loss), clipped so one tweet cannot decide a user
+def log_odds(model, X, clip=4.):
+    if hasattr(model, 'predict_proba'):
+        try:
+            probabilities = model.predict_proba(X)[:, 1]
+            probabilities = np.clip(probabilities, 1e-12, 1 - 1e-12)
+            return np.clip(np.log(probabilities / (1 - probabilities)), -clip, clip)
+        except AttributeError:
+            pass
+    return np.clip(model.decision_function(X), -clip, clip)
+
+class UserScoreAggregator(object):
+
+    # threshold is the log-odds a user needs to be decided, e.g. log(0.95 / 0.05) = 2.94 for 95% confidence.
+    # prior is the log-odds of the training class balance
+    def __init__(self, threshold=2.94, min_tweets=3, prior=0.):
+        self.threshold = threshold
+        self.min_tweets = min_tweets
+        self.prior = prior
+        self.users = pd.Index([])
+        self.tweet_num = np.zeros(0, dtype='int64')
+        self.evidence = np.zeros(0)
+        self.decision = np.zeros(0, dtype='int8')
+        self.decided_after = np.zeros(0, dtype='int64')
+
+    def add_users(self, userids):
+        userids = pd.Index(userids).unique()
+        new = userids[self.users.get_indexer(userids) < 0] if len(self.users) else userids
+        k = len(new)
+        if k == 0:
+            return
+        self.users = self.users.append(new)
+        self.tweet_num = np.concatenate([self.tweet_num, np.zeros(k, dtype='int64')])
+        self.evidence = np.concatenate([self.evidence, np.zeros(k)])
+        self.decision = np.concatenate([self.decision, np.full(k, -1, dtype='int8')])
+        self.decided_after = np.concatenate([self.decided_after, np.zeros(k, dtype='int64')])
+
+    @property
+    def log_odds(self):
+        return self.prior + self.evidence
+
+    # Fold in the log-odds of a batch of tweets and return the user ids decided by this batch. A decided user's
+    # decision stays as it is, their later tweets still count towards log_odds
+    def update(self, userids, tweet_log_odds):
+        self.add_users(userids)
+        codes = self.users.get_indexer(userids)
+        n = len(self.users)
+        self.tweet_num += np.bincount(codes, minlength=n)
+        self.evidence += np.bincount(codes, weights=np.asarray(tweet_log_odds) - self.prior, minlength=n)
+        log_odds = self.log_odds
+        touched = np.bincount(codes, minlength=n) > 0
+        deciding = touched & (self.decision < 0) & (self.tweet_num >= self.min_tweets) & \
+                   (np.abs(log_odds) >= self.threshold)
+        self.decision[deciding] = log_odds[deciding] > 0
+        self.decided_after[deciding] = self.tweet_num[deciding]
+        return self.users[deciding]
+
+    # Current state of every user: tweets seen, log-odds, probability and the decision (NaN while undecided)
+    def scores(self):
+        log_odds = self.log_odds
+        return pd.DataFrame({
+            'userid': self.users,
+            'tweets': self.tweet_num,
+            'log_odds': log_odds,
+            'probability': 1 / (1 + np.exp(-log_odds)),
+            'decision': np.where(self.decision < 0, np.nan, self.decision),
+            'decided_after': np.where(self.decision < 0, np.nan, self.decided_after),
+        })
+
+class TweetScorer(object):
+
+    # features turns a batch of BoW strings into model input, e.g. StreamingClassifier.features or a fitted
+    # vectorizer's transform
+    def __init__(self, model, features, aggregator=None, clip=4.):
+        self.model = model
+        self.features = features
+        self.aggregator = aggregator if aggregator is not None else UserScoreAggregator()
+        self.clip = clip
+
+    # Log-odds of every tweet of a frame with userid and BoW columns
+    def score_frame(self, tweet_df):
+        texts = streamingTraining.bow_strings(tweet_df.loc[:,'BoW'])
+        return log_odds(self.model, self.features(texts), self.clip)
+
+    # Fold a frame of tweets into the per user scores, returns the user ids it decided
+    def update(self, tweet_df):
+        return self.aggregator.update(tweet_df.loc[:,'userid'].to_numpy(), self.score_frame(tweet_df))
+
+    # Score a stream of tweet frames in arrival order, yielding the users decided by each frame
+    def stream(self, frames):
+        for tweet_df in frames:
+            decided = self.update(tweet_df)
+            if len(decided):
+                yield decided
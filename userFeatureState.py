@@ -0,0 +1,219 @@
+import pandas as pd
+import numpy as np
+from numpy import NaN
+try:
+    from . import circularStatistics, rateStatistics, tokenStore
+except ImportError:
+    import circularStatistics, rateStatistics, tokenStore
+
+# Mergeable per-user partial state for the pattern of life features and the user Bag of Words. Tweets are folded
+# in chunk by chunk with update(), two states built from different chunks can be combined with merge(), and the
+# user columns of patternOfLife/process_users are derived from the state at the end. The time statistics are
+# kept as a per-user minute of day histogram, which is all that is needed to recompute them exactly. A state can
+# be saved to an .npz file and loaded again later, so newly mined tweets only cost an update() and an apply().
+
+METRIC_COLUMNS = ['avg_quote_count', 'avg_like_count', 'avg_retweet_count', 'avg_hashtags', 'avg_urls', 'avg_user_mentions']
+METRIC_SOURCES = ['quote_count', 'like_count', 'retweet_count', 'hashtags', 'urls', 'user_mentions']
+MINUTES_PER_DAY = 24 * 60
+NO_STAMP_FIRST = np.iinfo('int64').max
+NO_STAMP_LAST = np.iinfo('int64').min
+COUNT_ARRAYS = ['tweet_num', 'retweet_num', 'language_num', 'english_num', 'counted_num']
+STATE_ARRAYS = COUNT_ARRAYS + ['first_stamp', 'last_stamp', 'metric_sums', 'metric_counts', 'minute_keys', 'minute_counts']
+
+class UserFeatureState(object):
+
+    def __init__(self, userids=(), en=True, non=True):
+        self.en = en
+        self.non = non
+        self.users = pd.Index([])
+        self.tweet_num = np.zeros(0, dtype='int64')
+        self.retweet_num = np.zeros(0, dtype='int64')
+        self.language_num = np.zeros(0, dtype='int64')
+        self.english_num = np.zeros(0, dtype='int64')
+        self.counted_num = np.zeros(0, dtype='int64')
+        self.first_stamp = np.zeros(0, dtype='int64')
+        self.last_stamp = np.zeros(0, dtype='int64')
+        self.metric_sums = np.zeros((0, len(METRIC_SOURCES)))
+        self.metric_counts = np.zeros((0, len(METRIC_SOURCES)), dtype='int64')
+        # Sorted user code * 1440 + minute of day keys and the number of tweets at each
+        self.minute_keys = np.zeros(0, dtype='int64')
+        self.minute_counts = np.zeros(0, dtype='int64')
+        # English tweet Bags of Words as token ids: TokenStores with a row per tweet and the user code of every row.
+        # Chunks are appended as they come and only grouped by user when the user BoW is asked for
+        self.vocabulary = tokenStore.Vocabulary()
+        self.bow_stores = []
+        self.bow_codes = []
+        self.add_users(userids)
+
+    # Append users that are not tracked yet, existing users keep their position
+    def add_users(self, userids):
+        userids = pd.Index(list(userids)).unique()
+        new = userids[self.users.get_indexer(userids) < 0] if len(self.users) else userids
+        k = len(new)
+        if k == 0:
+            return
+        self.users = self.users.append(new)
+        for name in COUNT_ARRAYS:
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(k, dtype='int64')]))
+        self.first_stamp = np.concatenate([self.first_stamp, np.full(k, NO_STAMP_FIRST)])
+        self.last_stamp = np.concatenate([self.last_stamp, np.full(k, NO_STAMP_LAST)])
+        self.metric_sums = np.vstack([self.metric_sums, np.zeros((k, len(METRIC_SOURCES)))])
+        self.metric_counts = np.vstack([self.metric_counts, np.zeros((k, len(METRIC_SOURCES)), dtype='int64')])
+
+    # Fold sorted, unique minute keys and their counts into the histogram. Keys already there get their counts
+    # added and new keys are inserted in place, so the histogram is never sorted again
+    def add_minutes(self, keys, counts):
+        counts = np.asarray(counts, dtype='int64')
+        positions = np.searchsorted(self.minute_keys, keys)
+        found = positions < len(self.minute_keys)
+        found[found] = self.minute_keys[positions[found]] == keys[found]
+        self.minute_counts[positions[found]] += counts[found]
+        self.minute_keys = np.insert(self.minute_keys, positions[~found], keys[~found])
+        self.minute_counts = np.insert(self.minute_counts, positions[~found], counts[~found])
+
+    # Fold a chunk of tweets into the state. Tweets of users that are not tracked are ignored, as they are by the
+    # feature functions. tweet_time must be datetime64, and BoW is only used when the chunk has that column
+    def update(self, tweet_df):
+        n = len(self.users)
+        codes = self.users.get_indexer(tweet_df.loc[:,'userid'])
+        known = codes >= 0
+        codes = codes[known]
+        tweets = tweet_df.loc[known]
+
+        self.tweet_num += np.bincount(codes, minlength=n)
+        self.retweet_num += np.bincount(codes[tweets.loc[:,'is_retweet'].astype('int').to_numpy() == 1], minlength=n)
+        language = tweets.loc[:,'tweet_language']
+        english = (language == 'en').to_numpy()
+        self.language_num += np.bincount(codes[language.notna().to_numpy()], minlength=n)
+        self.english_num += np.bincount(codes[english], minlength=n)
+
+        tweet_time = pd.to_datetime(tweets.loc[:,'tweet_time'])
+        dated = (tweet_time.notna() & (tweet_time != '1900-01-01 00:00')).to_numpy()
+        stamps = tweet_time.to_numpy(dtype='datetime64[ns]').astype('int64')
+        dated_codes = codes[dated]
+        self.counted_num += np.bincount(dated_codes[tweets.loc[:,'tweetid'].notna().to_numpy()[dated]], minlength=n)
+        np.minimum.at(self.first_stamp, dated_codes, stamps[dated])
+        np.maximum.at(self.last_stamp, dated_codes, stamps[dated])
+
+        for i, column in enumerate(METRIC_SOURCES):
+            values = tweets.loc[:,column].to_numpy(dtype='float64')
+            valid = ~np.isnan(values)
+            self.metric_sums[:, i] += np.bincount(codes[valid], weights=values[valid], minlength=n)
+            self.metric_counts[:, i] += np.bincount(codes[valid], minlength=n)
+
+        selected = circularStatistics.time_statistics_mask(tweets.assign(tweet_time=tweet_time), self.en, self.non)
+        hours, minutes = circularStatistics.hours_minutes(tweet_time)
+        keys = codes[selected] * MINUTES_PER_DAY + hours[selected] * 60 + minutes[selected]
+        keys, counts = np.unique(keys, return_counts=True)
+        self.add_minutes(keys, counts)
+
+        if 'BoW' in tweets.columns:
+            self.update_bows(tweets)
+
+    # Fold only the Bag of Words of the English tweets, for chunks without the pattern of life columns
+    def update_bows(self, tweet_df):
+        codes = self.users.get_indexer(tweet_df.loc[:,'userid'])
+        english = (codes >= 0) & (tweet_df.loc[:,'tweet_language'] == 'en').to_numpy()
+        if english.any():
+            store = tokenStore.TokenStore.from_bows(tweet_df.loc[english, 'BoW'], self.vocabulary)
+            self.append_bows(codes[english], store)
+
+    # Append BoW rows using this state's vocabulary, codes holds the user code of every row
+    def append_bows(self, codes, store):
+        self.bow_codes.append(np.asarray(codes, dtype='int64'))
+        self.bow_stores.append(store)
+
+    # Every BoW row folded in so far as one TokenStore, and the user code of each row
+    def bow_rows(self):
+        if len(self.bow_stores) != 1:
+            self.bow_stores = [tokenStore.TokenStore.concat(self.bow_stores, self.vocabulary)]
+            self.bow_codes = [np.concatenate(self.bow_codes) if self.bow_codes else np.zeros(0, dtype='int64')]
+        return self.bow_stores[0], self.bow_codes[0]
+
+    # Combine another state into this one, the other state's tweets count as coming after this one's
+    def merge(self, other):
+        self.add_users(other.users)
+        position = self.users.get_indexer(other.users)
+        for name in COUNT_ARRAYS:
+            getattr(self, name)[position] += getattr(other, name)
+        self.first_stamp[position] = np.minimum(self.first_stamp[position], other.first_stamp)
+        self.last_stamp[position] = np.maximum(self.last_stamp[position], other.last_stamp)
+        self.metric_sums[position] += other.metric_sums
+        self.metric_counts[position] += other.metric_counts
+        other_codes, other_minutes = np.divmod(other.minute_keys, MINUTES_PER_DAY)
+        keys = position[other_codes] * MINUTES_PER_DAY + other_minutes
+        order = np.argsort(keys)
+        self.add_minutes(keys[order], other.minute_counts[order])
+        other_store, other_codes = other.bow_rows()
+        token_ids = self.vocabulary.ids(other.vocabulary.tokens)
+        self.append_bows(position[other_codes],
+                         tokenStore.TokenStore(other_store.offsets, token_ids[other_store.ids], self.vocabulary))
+        return self
+
+    # Pattern of life columns for every tracked user, in the order patternOfLife writes them
+    def features(self):
+        n = len(self.users)
+        features = {}
+        features['retweet_ratio'] = np.divide(self.retweet_num, self.tweet_num, out=np.zeros(n), where=self.tweet_num > 0)
+        features['english_tweet_proportion'] = np.divide(self.english_num, self.language_num, out=np.zeros(n), where=self.language_num > 0)
+
+        codes, minutes_of_day = np.divmod(self.minute_keys, MINUTES_PER_DAY)
+        hours, minutes = np.divmod(minutes_of_day, 60)
+        features.update(circularStatistics.segment_time_statistics(codes, hours, minutes, n, weights=self.minute_counts))
+
+        features.update(rateStatistics.span_rates(self.first_stamp, self.last_stamp, self.counted_num))
+
+        means = np.full(self.metric_sums.shape, NaN)
+        np.divide(self.metric_sums, self.metric_counts, out=means, where=self.metric_counts > 0)
+        for i, column in enumerate(METRIC_COLUMNS):
+            features[column] = means[:, i]
+        return pd.DataFrame(features, index=self.users)
+
+    # Write the user Bag of Words and, if features is set, the pattern of life columns into user_df
+    def apply(self, user_df, toList=True, features=True):
+        self.add_users(user_df.loc[:,'userid'])
+        rows = self.users.get_indexer(user_df.loc[:,'userid'])
+        store = self.token_store()
+        words = np.array(self.vocabulary.tokens, dtype=object)[store.ids]
+        bows = [words[store.offsets[row]:store.offsets[row + 1]].tolist() for row in rows]
+        if not toList:
+            bows = [' '.join(bow) for bow in bows]
+        user_df.loc[:,'BoW'] = pd.Series(bows, index=user_df.index, dtype='object')
+        if features:
+            for column, values in self.features().items():
+                user_df.loc[:,column] = values.to_numpy()[rows]
+
+    # The users' Bag of Words as a TokenStore with a row per tracked user, e.g. for their token count matrix.
+    # Pass a vocabulary (e.g. a HashedVocabulary) to get its ids instead of the state's own
+    def token_store(self, vocabulary=None):
+        store, codes = self.bow_rows()
+        store = store.group(codes, len(self.users))
+        if vocabulary is not None:
+            store = tokenStore.TokenStore(store.offsets, vocabulary.ids(self.vocabulary.tokens)[store.ids], vocabulary)
+        return store
+
+    # Save the state in .npz format to path as given (numpy would add an .npz suffix to a file name without one).
+    # The Bags of Words are stored as token ids, uncompressed since compressing them costs more than the update
+    def save(self, path):
+        store = self.token_store()
+        users = self.users.to_numpy()
+        integer_users = pd.api.types.is_integer_dtype(self.users)
+        arrays = {name: getattr(self, name) for name in STATE_ARRAYS}
+        with open(path, 'wb') as f:
+            np.savez(f, users=users.astype('int64') if integer_users else users.astype(str), integer_users=integer_users,
+                     en=self.en, non=self.non, bow_offsets=store.offsets, bow_ids=store.ids,
+                     tokens=np.array(store.vocabulary.tokens, dtype=str), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            stored = dict(np.load(f))
+        state = cls(en=bool(stored['en']), non=bool(stored['non']))
+        users = stored['users']
+        state.users = pd.Index(users if bool(stored['integer_users']) else users.astype(object))
+        for name in STATE_ARRAYS:
+            setattr(state, name, stored[name])
+        state.vocabulary = tokenStore.Vocabulary([str(token) for token in stored['tokens']])
+        store = tokenStore.TokenStore(stored['bow_offsets'], stored['bow_ids'], state.vocabulary)
+        state.append_bows(np.arange(len(state.users)), store)
+        return state